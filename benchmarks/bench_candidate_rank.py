@@ -0,0 +1,62 @@
+"""Замер времени ранжирования кандидатов в зависимости от их количества.
+
+Запуск из корня проекта:
+```shell
+python3 -m benchmarks.bench_candidate_rank
+```
+"""
+
+import random
+import time
+
+from selection.candidate_rank import rank_candidates
+
+SIZES = (20, 100, 200, 500, 1000)
+REPEATS = 50
+INTERESTS = ("музыка", "кино", "спорт", "книги", "путешествия", "игры")
+
+
+def make_candidates(count):
+    """Создание кандидатов со случайными полями профиля.
+
+    Args:
+        count (int): Количество кандидатов.
+
+    Returns:
+        list: Пользователи в формате результатов поиска ВК.
+    """
+    now = int(time.time())
+    candidates = []
+    for user_id in range(count):
+        candidate = {
+            "id": user_id,
+            "city": {"id": random.choice((1, 2, 99))},
+            "last_seen": {"time": now - random.randrange(30 * 86400)},
+            "has_photo": random.randint(0, 1),
+            "common_count": random.randrange(5),
+            "interests": ", ".join(random.sample(INTERESTS, 2)),
+        }
+        # Часть пользователей скрывает год рождения
+        if random.random() < 0.8:
+            candidate["bdate"] = f"1.1.{random.randint(1990, 1994)}"
+        candidates.append(candidate)
+    return candidates
+
+
+def main():
+    """Замер на наборах от 20 до 1000 кандидатов."""
+    pair_info = {"age": time.localtime().tm_year - 1992, "city_id": 1, "interests": "кино, книги"}
+    # Прогрев: первый вызов загружает NumPy
+    rank_candidates(make_candidates(SIZES[0]), pair_info)
+    print(f"{'candidates':>10} {'rank, us':>10} {'per item, us':>13}")
+    for size in SIZES:
+        candidates = make_candidates(size)
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            rank_candidates(candidates, pair_info)
+        elapsed = (time.perf_counter() - start) / REPEATS * 10 ** 6
+        print(f"{size:>10} {elapsed:>10.1f} {elapsed / size:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Замер времени поиска активного подбора в зависимости от размера таблицы.
+
+Запуск из корня проекта:
+```shell
+python3 -m benchmarks.bench_selection_lookup 1000000
+```
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+from db.db_tools import SelectionDB
+
+# Доля активных подборов в таблице
+ACTIVE_SHARE = 0.01
+LOOKUPS = 5000
+
+
+def fill_selections(db, start_row, end_row):
+    """Заполнение таблицы подборов.
+
+    Пользователь с ИД N имеет активный подбор, если N делится на 1 / ACTIVE_SHARE.
+
+    Args:
+        db (SelectionDB): БД подбора.
+        start_row (int): Номер первой строки.
+        end_row (int): Номер строки после последней.
+    """
+    now = int(time.time())
+    active_step = int(1 / ACTIVE_SHARE)
+    rows = [
+        {"user_id": user_id, "selection_id": str(uuid.uuid4()), "date": now,
+         "is_closed": 0 if user_id % active_step == 0 else 1}
+        for user_id in range(start_row, end_row)]
+    sql_query = """INSERT INTO selections(vk_user_id, selection_id, stage_id, start_date, upadte_date, is_closed)
+    VALUES(:user_id, :selection_id, 5, :date, :date, :is_closed);
+    """
+    with db.backend.transaction() as transaction:
+        transaction.executemany(sql_query, rows)
+
+
+def measure_lookups(db, rows_count):
+    """Замер среднего времени поиска активного подбора.
+
+    Args:
+        db (SelectionDB): БД подбора.
+        rows_count (int): Количество строк в таблице.
+
+    Returns:
+        float: Среднее время одного поиска, мкс.
+    """
+    active_step = int(1 / ACTIVE_SHARE)
+    user_ids = [random.randrange(0, rows_count, active_step) for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for user_id in user_ids:
+        db.load_active_selection(user_id)
+    return (time.perf_counter() - start) / LOOKUPS * 10 ** 6
+
+
+def main(max_rows):
+    """Замер на таблицах от 10 тыс. строк до max_rows.
+
+    Args:
+        max_rows (int): Максимальное количество строк.
+    """
+    db_filename = os.path.join(tempfile.mkdtemp(), "bench_selection.db")
+    db = SelectionDB(db_filename)
+    rows_count = 0
+    size = 10000
+    print(f"{'rows':>10} {'lookup, us':>12}")
+    while size <= max_rows:
+        fill_selections(db, rows_count, size)
+        rows_count = size
+        db.backend.analyze()
+        print(f"{rows_count:>10} {measure_lookups(db, rows_count):>12.1f}")
+        size *= 10
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
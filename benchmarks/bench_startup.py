@@ -0,0 +1,130 @@
+"""Замер времени запуска бота.
+
+Время импорта модулей бота замеряется в отдельных процессах.
+Время до получения первого события замеряется с локальным сервером
+Long Poll: без сохраненного состояния (с запросом groups.getLongPollServer
+с задержкой, имитирующей обращение к ВК) и с сохраненным состоянием.
+
+Запуск из корня проекта:
+```shell
+python3 -m benchmarks.bench_startup
+```
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from vk.longpoll import ResumableBotLongPoll
+
+REPEATS = 5
+
+# Минимальная настройка, достаточная для импорта main
+CONFIG = """[VK]
+db_name=selection.db
+token=
+group_id=1
+fields=bdate,city,country,sex
+"""
+
+# Время ответа API ВК, имитируемое при запросе groups.getLongPollServer, сек
+API_DELAY = 0.1
+
+
+def measure_import(module):
+    """Замер времени импорта модуля в новом процессе.
+
+    Процесс запускается во временном каталоге с минимальным config.ini.
+
+    Args:
+        module (str): Название модуля.
+
+    Returns:
+        float: Лучшее время импорта за вычетом запуска интерпретатора, мс.
+    """
+    work_dir = tempfile.mkdtemp()
+    with open(os.path.join(work_dir, "config.ini"), "w", encoding="utf-8") as config_file:
+        config_file.write(CONFIG)
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=work_dir, env=env)
+        return time.perf_counter() - start
+
+    baseline = min(run("pass") for _ in range(REPEATS))
+    elapsed = min(run(f"import {module}") for _ in range(REPEATS))
+    return (elapsed - baseline) * 1000
+
+
+class LongPollHandler(BaseHTTPRequestHandler):
+    """Локальный сервер Long Poll, сразу возвращающий одно событие."""
+
+    def do_GET(self):
+        body = json.dumps({"ts": "2", "updates": [{
+            "type": "message_new", "group_id": 1, "event_id": "e1",
+            "object": {"message": {"from_id": 1, "peer_id": 1, "text": "привет"}}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Запросы не выводятся в консоль."""
+
+
+class FakeGroupSession:
+    """Сессия сообщества, отвечающая на groups.getLongPollServer с задержкой.
+
+    Args:
+        server (str): Адрес локального сервера Long Poll.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def method(self, method, values=None):
+        time.sleep(API_DELAY)
+        return {"server": self.server, "key": "key", "ts": "1"}
+
+
+def measure_first_event(server, state_filename):
+    """Замер времени от создания Long Poll до получения первого события.
+
+    Args:
+        server (str): Адрес локального сервера Long Poll.
+        state_filename (str): Путь до файла состояния Long Poll.
+
+    Returns:
+        float: Время, мс.
+    """
+    start = time.perf_counter()
+    longpoll = ResumableBotLongPoll(FakeGroupSession(server), 1, state_filename)
+    next(longpoll.listen())
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    """Вывод времени импорта и времени до первого события."""
+    print(f"{'import main, ms':<40} {measure_import('main'):>8.1f}")
+
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), LongPollHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    server = f"http://127.0.0.1:{http_server.server_address[1]}"
+    state_filename = os.path.join(tempfile.mkdtemp(), "longpoll.json")
+    # Первый запуск получает сервер и ключ, следующие продолжают с сохраненного состояния
+    cold = measure_first_event(server, state_filename)
+    resumed = min(measure_first_event(server, state_filename) for _ in range(REPEATS))
+    print(f"{'first event without saved state, ms':<40} {cold:>8.1f}")
+    print(f"{'first event with saved state, ms':<40} {resumed:>8.1f}")
+    http_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
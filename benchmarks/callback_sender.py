@@ -0,0 +1,153 @@
+"""Отправка тестовых событий Callback API.
+
+Отправляет запрос подтверждения и события message_new от нескольких
+пользователей, каждое десятое событие - повторно, как при повторной
+отправке ВК. Выводит время ответа сервера и коды ответов. Без адреса
+события отправляются локальному серверу CallbackServer с обработчиком,
+считающим события; с адресом - запущенному боту, ИД сообщества
+и секретный ключ берутся из config.ini.
+
+Запуск из корня проекта:
+```shell
+python3 -m benchmarks.callback_sender 1000
+python3 -m benchmarks.callback_sender 1000 http://127.0.0.1:8080/callback
+```
+"""
+
+import asyncio
+import configparser
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+import aiohttp
+
+from vk.callback import CallbackServer
+
+USERS = 50
+CONCURRENCY = 10
+# Каждое N-е событие отправляется повторно
+REPEAT_EVERY = 10
+
+
+def get_events(group_id, secret, count):
+    """Тестовые события message_new.
+
+    Args:
+        group_id (int): ИД сообщества.
+        secret (str): Секретный ключ.
+        count (int): Количество событий без повторов.
+
+    Returns:
+        list: События в формате Callback API.
+    """
+    now = int(time.time())
+    events = []
+    for number in range(1, count + 1):
+        user_id = number % USERS + 1
+        event = {
+            "type": "message_new", "group_id": group_id, "event_id": f"fake{now}_{number}",
+            "v": "5.131", "secret": secret, "object": {"message": {
+                "id": 0, "date": now, "from_id": user_id, "peer_id": user_id,
+                "conversation_message_id": now * 1000 + number, "text": "привет"}}}
+        events.append(event)
+        if number % REPEAT_EVERY == 0:
+            events.append(event)
+    return events
+
+
+async def send_events(url, group_id, secret, count):
+    """Отправка подтверждения и событий.
+
+    Args:
+        url (str): Адрес сервера Callback API.
+        group_id (int): ИД сообщества.
+        secret (str): Секретный ключ.
+        count (int): Количество событий без повторов.
+
+    Returns:
+        tuple: Строка подтверждения, коды ответов, время ответов, сек.
+    """
+    statuses = Counter()
+    timings = []
+    queue = asyncio.Queue()
+    for event in get_events(group_id, secret, count):
+        queue.put_nowait(event)
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json={"type": "confirmation", "group_id": group_id}) as response:
+            confirmation = await response.text()
+
+        async def sender():
+            while not queue.empty():
+                event = queue.get_nowait()
+                start = time.perf_counter()
+                async with session.post(url, json=event) as response:
+                    await response.read()
+                timings.append(time.perf_counter() - start)
+                statuses[response.status] += 1
+
+        await asyncio.gather(*(sender() for _ in range(CONCURRENCY)))
+    return confirmation, statuses, timings
+
+
+def start_local_server(handled):
+    """Запуск локального сервера Callback API в фоновом потоке.
+
+    Args:
+        handled (Counter): Счетчик обработанных событий по ИД пользователя.
+
+    Returns:
+        str: Адрес сервера.
+    """
+
+    def handler(event, done):
+        handled[event.obj["message"]["from_id"]] += 1
+        done()
+
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        port = free_socket.getsockname()[1]
+    server = CallbackServer(handler, 1, "confirmed", "secret", "127.0.0.1", port)
+    threading.Thread(target=server.run, daemon=True).start()
+    # Ожидание запуска сервера
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}{server.path}"
+
+
+def main(count, url=None):
+    """Вывод результатов отправки событий.
+
+    Args:
+        count (int): Количество событий без повторов.
+        url (str, optional): Адрес сервера, без него запускается локальный сервер.
+    """
+    handled = Counter()
+    if url:
+        config = configparser.ConfigParser()
+        config.read("config.ini")
+        group_id = int(config["VK"]["group_id"])
+        secret = config.get("CALLBACK", "secret", fallback="")
+    else:
+        url = start_local_server(handled)
+        group_id, secret = 1, "secret"
+    confirmation, statuses, timings = asyncio.run(send_events(url, group_id, secret, count))
+    timings.sort()
+    print(f"{'confirmation':<24} {confirmation}")
+    print(f"{'responses':<24} {dict(statuses)}")
+    print(f"{'response p50, ms':<24} {timings[len(timings) // 2] * 1000:>8.2f}")
+    print(f"{'response p99, ms':<24} {timings[int(len(timings) * 0.99)] * 1000:>8.2f}")
+    if handled:
+        # Обработка событий локальным сервером завершается после ответов
+        time.sleep(0.5)
+        print(f"{'handled events':<24} {sum(handled.values())}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000, sys.argv[2] if len(sys.argv) > 2 else None)
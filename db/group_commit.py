@@ -0,0 +1,84 @@
+"""Групповая фиксация изменений нескольких событий одной транзакцией."""
+
+import threading
+import time
+from queue import Empty, Queue
+
+
+class GroupCommit:
+    """Изменения одного события, ожидающие фиксации.
+
+    Args:
+        statements (list): Запросы с параметрами.
+    """
+
+    def __init__(self, statements):
+        self.statements = statements
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitter:
+    """Поток, фиксирующий изменения нескольких событий одной транзакцией.
+
+    Изменения, поступившие в течение окна ожидания, записываются
+    одной транзакцией, поэтому под нагрузкой на несколько сообщений
+    приходится одна синхронизация с диском.
+
+    Args:
+        backend (SQLiteBackend | SQLAlchemyBackend): Хранилище.
+        window (float, optional): Окно ожидания изменений других событий, сек.
+    """
+
+    def __init__(self, backend, window=0.005):
+        self.backend = backend
+        self.window = window
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self.thread.start()
+
+    def commit(self, statements):
+        """Фиксация изменений события с ожиданием записи.
+
+        Args:
+            statements (list): Запросы с параметрами.
+        """
+        group_commit = GroupCommit(statements)
+        self.queue.put(group_commit)
+        group_commit.done.wait()
+        if group_commit.error:
+            raise group_commit.error
+
+    def _run(self):
+        """Цикл потока фиксации."""
+        while True:
+            group = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    group.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+            try:
+                self._write(group)
+            except Exception:
+                # Ошибка одного события не должна отменять изменения остальных
+                for group_commit in group:
+                    try:
+                        self._write([group_commit])
+                    except Exception as e:
+                        group_commit.error = e
+            for group_commit in group:
+                group_commit.done.set()
+
+    def _write(self, group):
+        """Запись изменений одной транзакцией.
+
+        Args:
+            group (list): Изменения событий.
+        """
+        self.backend.execute([
+            statement for group_commit in group for statement in group_commit.statements])
@@ -0,0 +1,371 @@
+"""Миграции структуры БД.
+
+Каждая миграция выполняется один раз в отдельной транзакции,
+номер примененной версии записывается в таблицу schema_version.
+"""
+
+import ast
+import json
+import time
+
+
+def migration_1_create_tables(cursor):
+    """Создание исходной структуры таблиц.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+    """
+    # Информация о подборах
+    sql_query = """CREATE TABLE IF NOT EXISTS selections(
+            vk_user_id INT,
+            vk_user_token TEXT,
+            vk_target_id INT,
+            vk_target_info TEXT,
+            selection_id TEXT,
+            stage_id INT,
+            start_date TEXT,
+            upadte_date TEXT,
+            end_date TEXT,
+            is_closed INT,
+            shown_user_ids TEXT,
+            result_vk_user_id INT);
+    """
+    cursor.execute(sql_query)
+    # Очередь кандидатов подбора
+    sql_query = """CREATE TABLE IF NOT EXISTS selection_candidates(
+            selection_id TEXT PRIMARY KEY,
+            search_params TEXT,
+            candidate_ids TEXT,
+            search_offset INT,
+            search_count INT);
+    """
+    cursor.execute(sql_query)
+    # Показанные кандидаты
+    sql_query = """CREATE TABLE IF NOT EXISTS shown_candidates(
+            vk_user_id INT,
+            vk_target_id INT,
+            candidate_id INT,
+            shown_date TEXT,
+            PRIMARY KEY (vk_user_id, vk_target_id, candidate_id)) WITHOUT ROWID;
+    """
+    cursor.execute(sql_query)
+
+
+def migration_2_move_shown_user_ids(cursor):
+    """Перенос показанных кандидатов из строк с ИД через "," в таблицу shown_candidates.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+    """
+    sql_query = """SELECT vk_user_id, vk_target_id, shown_user_ids, upadte_date FROM selections
+    WHERE shown_user_ids IS NOT NULL;
+    """
+    shown_candidates = []
+    for vk_user_id, vk_target_id, shown_user_ids, upadte_date in cursor.execute(sql_query).fetchall():
+        for val in shown_user_ids.split(","):
+            if val:
+                shown_candidates.append((vk_user_id, vk_target_id, int(val), upadte_date))
+    sql_query = """INSERT OR IGNORE INTO shown_candidates(vk_user_id, vk_target_id, candidate_id, shown_date)
+    VALUES(?, ?, ?, ?);
+    """
+    cursor.executemany(sql_query, shown_candidates)
+    cursor.execute("UPDATE selections SET shown_user_ids = NULL WHERE shown_user_ids IS NOT NULL;")
+
+
+def migration_3_selections_primary_key(cursor):
+    """Первичный ключ selection_id, индекс активных подборов и даты в секундах Unix.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+    """
+    sql_query = """CREATE TABLE selections_v3(
+            vk_user_id INT,
+            vk_user_token TEXT,
+            vk_target_id INT,
+            vk_target_info TEXT,
+            selection_id TEXT PRIMARY KEY,
+            stage_id INT,
+            start_date INTEGER,
+            upadte_date INTEGER,
+            end_date INTEGER,
+            is_closed INT NOT NULL DEFAULT 0,
+            result_vk_user_id INT);
+    """
+    cursor.execute(sql_query)
+    # Даты хранились как str(datetime.now()) в локальном времени
+    sql_query = """INSERT OR IGNORE INTO selections_v3
+    SELECT vk_user_id, vk_user_token, vk_target_id, vk_target_info, selection_id, stage_id,
+        CAST(strftime('%s', start_date, 'utc') AS INTEGER),
+        CAST(strftime('%s', upadte_date, 'utc') AS INTEGER),
+        CAST(strftime('%s', end_date, 'utc') AS INTEGER),
+        COALESCE(is_closed, 0), result_vk_user_id
+    FROM selections;
+    """
+    cursor.execute(sql_query)
+    cursor.execute("DROP TABLE selections;")
+    cursor.execute("ALTER TABLE selections_v3 RENAME TO selections;")
+    sql_query = """CREATE INDEX selections_active_user ON selections(vk_user_id)
+    WHERE is_closed = 0;
+    """
+    cursor.execute(sql_query)
+    # Даты показа кандидатов
+    sql_query = """CREATE TABLE shown_candidates_v3(
+            vk_user_id INT,
+            vk_target_id INT,
+            candidate_id INT,
+            shown_date INTEGER,
+            PRIMARY KEY (vk_user_id, vk_target_id, candidate_id)) WITHOUT ROWID;
+    """
+    cursor.execute(sql_query)
+    sql_query = """INSERT INTO shown_candidates_v3
+    SELECT vk_user_id, vk_target_id, candidate_id,
+        CAST(strftime('%s', shown_date, 'utc') AS INTEGER)
+    FROM shown_candidates;
+    """
+    cursor.execute(sql_query)
+    cursor.execute("DROP TABLE shown_candidates;")
+    cursor.execute("ALTER TABLE shown_candidates_v3 RENAME TO shown_candidates;")
+
+
+def migration_4_target_info_json(cursor):
+    """Перевод информации о целевом пользователе из str(dict) в JSON.
+
+    Записи, которые не удалось разобрать, очищаются: информация
+    будет заново получена из ВК по vk_target_id.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+    """
+    sql_query = "SELECT selection_id, vk_target_info FROM selections WHERE vk_target_info IS NOT NULL;"
+    target_infos = []
+    for selection_id, vk_target_info in cursor.execute(sql_query).fetchall():
+        try:
+            json.loads(vk_target_info)
+            continue
+        except ValueError:
+            pass
+        try:
+            vk_target_info = json.dumps(
+                ast.literal_eval(vk_target_info), ensure_ascii=False, separators=(",", ":"))
+        except (ValueError, SyntaxError):
+            vk_target_info = None
+        target_infos.append((vk_target_info, selection_id))
+    sql_query = "UPDATE selections SET vk_target_info = ? WHERE selection_id = ?;"
+    cursor.executemany(sql_query, target_infos)
+
+
+def migration_5_selections_history(cursor):
+    """Таблица архива закрытых подборов и индекс для отбора подборов к архивации.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+    """
+    # Токены пользователей в архив не переносятся
+    sql_query = """CREATE TABLE IF NOT EXISTS selections_history(
+            vk_user_id INT,
+            vk_target_id INT,
+            vk_target_info TEXT,
+            selection_id TEXT PRIMARY KEY,
+            stage_id INT,
+            start_date INTEGER,
+            upadte_date INTEGER,
+            end_date INTEGER,
+            result_vk_user_id INT,
+            archive_date INTEGER);
+    """
+    cursor.execute(sql_query)
+    cursor.execute("CREATE INDEX selections_history_end ON selections_history(end_date);")
+    cursor.execute("UPDATE selections SET end_date = upadte_date WHERE is_closed = 1 AND end_date IS NULL;")
+    sql_query = """CREATE INDEX selections_closed_end ON selections(end_date)
+    WHERE is_closed = 1;
+    """
+    cursor.execute(sql_query)
+
+
+def migration_6_candidate_index(cursor):
+    """Локальный индекс кандидатов по городу, полу, году рождения и семейному положению.
+
+    Кандидаты корзины хранятся столбцами: каждый столбец - упакованный массив чисел.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+    """
+    sql_query = """CREATE TABLE IF NOT EXISTS candidate_index(
+            city_id INT,
+            sex INT,
+            birth_year INT,
+            relation INT,
+            candidate_ids BLOB,
+            birth_days BLOB,
+            last_seen BLOB,
+            has_photo BLOB,
+            search_count INT,
+            update_date INTEGER,
+            PRIMARY KEY (city_id, sex, birth_year, relation));
+    """
+    cursor.execute(sql_query)
+    cursor.execute("CREATE INDEX candidate_index_update ON candidate_index(update_date);")
+
+
+def migration_7_candidate_position(cursor):
+    """Позиция следующего кандидата в очереди подбора.
+
+    Очередь записывается один раз при заполнении, при выдаче кандидата
+    обновляется только позиция.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+    """
+    cursor.execute("ALTER TABLE selection_candidates ADD COLUMN candidate_position INT NOT NULL DEFAULT 0;")
+
+
+MIGRATIONS = (
+    (1, migration_1_create_tables),
+    (2, migration_2_move_shown_user_ids),
+    (3, migration_3_selections_primary_key),
+    (4, migration_4_target_info_json),
+    (5, migration_5_selections_history),
+    (6, migration_6_candidate_index),
+    (7, migration_7_candidate_position),
+)
+
+
+def get_schema_version(cursor):
+    """Получение номера текущей версии структуры БД.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор БД.
+
+    Returns:
+        int: Номер версии, 0 для пустой БД.
+    """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_version(
+            version INT PRIMARY KEY,
+            applied_date INTEGER);
+    """)
+    version = cursor.execute("SELECT MAX(version) FROM schema_version;").fetchone()[0]
+    return version or 0
+
+
+def migrate(connection):
+    """Применение недостающих миграций.
+
+    Args:
+        connection (sqlite3.Connection): Соединение с БД.
+    """
+    cursor = connection.cursor()
+    version = get_schema_version(cursor)
+    for migration_version, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        # Другой процесс мог применить миграцию, пока мы ждали блокировку
+        cursor.execute("BEGIN IMMEDIATE;")
+        try:
+            version = get_schema_version(cursor)
+            if migration_version <= version:
+                connection.commit()
+                continue
+            migration(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version(version, applied_date) VALUES(?, ?);",
+                (migration_version, int(time.time())))
+        except Exception:
+            connection.rollback()
+            raise
+        connection.commit()
+
+
+# Структура таблиц на сервере БД соответствует последней миграции SQLite:
+# данные старых форматов на сервере не хранились
+SERVER_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS selections(
+            vk_user_id BIGINT,
+            vk_user_token TEXT,
+            vk_target_id BIGINT,
+            vk_target_info TEXT,
+            selection_id TEXT PRIMARY KEY,
+            stage_id INT,
+            start_date BIGINT,
+            upadte_date BIGINT,
+            end_date BIGINT,
+            is_closed INT NOT NULL DEFAULT 0,
+            result_vk_user_id BIGINT);
+    """,
+    """CREATE INDEX IF NOT EXISTS selections_active_user ON selections(vk_user_id)
+    WHERE is_closed = 0;
+    """,
+    """CREATE INDEX IF NOT EXISTS selections_closed_end ON selections(end_date)
+    WHERE is_closed = 1;
+    """,
+    """CREATE TABLE IF NOT EXISTS selection_candidates(
+            selection_id TEXT PRIMARY KEY,
+            search_params TEXT,
+            candidate_ids TEXT,
+            search_offset INT,
+            search_count INT);
+    """,
+    """ALTER TABLE selection_candidates
+    ADD COLUMN IF NOT EXISTS candidate_position INT NOT NULL DEFAULT 0;
+    """,
+    """CREATE TABLE IF NOT EXISTS shown_candidates(
+            vk_user_id BIGINT,
+            vk_target_id BIGINT,
+            candidate_id BIGINT,
+            shown_date BIGINT,
+            PRIMARY KEY (vk_user_id, vk_target_id, candidate_id));
+    """,
+    """CREATE TABLE IF NOT EXISTS selections_history(
+            vk_user_id BIGINT,
+            vk_target_id BIGINT,
+            vk_target_info TEXT,
+            selection_id TEXT PRIMARY KEY,
+            stage_id INT,
+            start_date BIGINT,
+            upadte_date BIGINT,
+            end_date BIGINT,
+            result_vk_user_id BIGINT,
+            archive_date BIGINT);
+    """,
+    "CREATE INDEX IF NOT EXISTS selections_history_end ON selections_history(end_date);",
+    """CREATE TABLE IF NOT EXISTS candidate_index(
+            city_id INT,
+            sex INT,
+            birth_year INT,
+            relation INT,
+            candidate_ids BYTEA,
+            birth_days BYTEA,
+            last_seen BYTEA,
+            has_photo BYTEA,
+            search_count INT,
+            update_date BIGINT,
+            PRIMARY KEY (city_id, sex, birth_year, relation));
+    """,
+    "CREATE INDEX IF NOT EXISTS candidate_index_update ON candidate_index(update_date);",
+)
+
+
+def migrate_server(backend):
+    """Создание структуры таблиц на сервере БД.
+
+    Таблица schema_version блокируется на время проверки, поэтому
+    несколько процессов бота могут запускаться одновременно.
+
+    Args:
+        backend (db.backends.SQLAlchemyBackend): Хранилище на сервере БД.
+    """
+    latest_version = MIGRATIONS[-1][0]
+    with backend.transaction() as transaction:
+        transaction.execute("""CREATE TABLE IF NOT EXISTS schema_version(
+                version INT PRIMARY KEY,
+                applied_date BIGINT);
+        """)
+    with backend.transaction() as transaction:
+        transaction.execute("LOCK TABLE schema_version IN EXCLUSIVE MODE;")
+        version = transaction.execute("SELECT MAX(version) FROM schema_version;").fetchone()[0]
+        if (version or 0) >= latest_version:
+            return
+        for sql_query in SERVER_SCHEMA:
+            transaction.execute(sql_query)
+        transaction.execute(
+            "INSERT INTO schema_version(version, applied_date) VALUES(:version, :applied_date);",
+            {"version": latest_version, "applied_date": int(time.time())})
@@ -0,0 +1,126 @@
+"""Архивация закрытых подборов и обслуживание БД."""
+
+import threading
+import time
+
+SECONDS_IN_DAY = 86400
+
+
+class SelectionRetention:
+    """Перенос закрытых подборов в архив и периодическое обслуживание БД.
+
+    Подборы переносятся небольшими порциями, каждая в своей короткой
+    транзакции, поэтому обработка сообщений не ждет долго блокировку БД.
+
+    Args:
+        db (SelectionDB): БД подбора.
+        max_age_days (float, optional): Через сколько дней после закрытия подбор переносится в архив.
+        history_days (float, optional): Сколько дней хранить архив, 0 - без ограничения.
+        batch_size (int, optional): Количество подборов в одной транзакции.
+        interval (float, optional): Период архивации и обновления статистики, сек.
+        vacuum_interval (float, optional): Период освобождения места в файле БД, сек.
+        api_cache (VkApiCache, optional): Кэш ответов ВК, устаревшие ответы которого удаляются из БД кэша.
+    """
+
+    def __init__(self, db, max_age_days=30, history_days=0, batch_size=500,
+                 interval=3600, vacuum_interval=86400, api_cache=None):
+        self.db = db
+        self.max_age_days = max_age_days
+        self.history_days = history_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.vacuum_interval = vacuum_interval
+        self.api_cache = api_cache
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск обслуживания по расписанию в фоновом потоке."""
+        self._thread = threading.Thread(target=self._run, name="selection-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка фонового потока."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def archive_closed(self):
+        """Перенос закрытых подборов старше max_age_days в архив.
+
+        Returns:
+            int: Количество перенесенных подборов.
+        """
+        end_date = int(time.time() - self.max_age_days * SECONDS_IN_DAY)
+        archived = 0
+        while not self._stop.is_set():
+            with self.db.backend.transaction() as transaction:
+                sql_query = """SELECT selection_id FROM selections
+                WHERE is_closed = 1 AND end_date < :end_date LIMIT :batch_size;
+                """
+                selection_ids = [{"selection_id": row[0]} for row in transaction.execute(
+                    sql_query, {"end_date": end_date, "batch_size": self.batch_size}).fetchall()]
+                sql_query = """INSERT INTO selections_history(vk_user_id, vk_target_id, vk_target_info,
+                    selection_id, stage_id, start_date, upadte_date, end_date, result_vk_user_id, archive_date)
+                SELECT vk_user_id, vk_target_id, vk_target_info, selection_id, stage_id,
+                    start_date, upadte_date, end_date, result_vk_user_id, :archive_date
+                FROM selections WHERE selection_id = :selection_id
+                ON CONFLICT DO NOTHING;
+                """
+                archive_date = int(time.time())
+                transaction.executemany(
+                    sql_query, [dict(params, archive_date=archive_date) for params in selection_ids])
+                transaction.executemany(
+                    "DELETE FROM selections WHERE selection_id = :selection_id;", selection_ids)
+                transaction.executemany(
+                    "DELETE FROM selection_candidates WHERE selection_id = :selection_id;", selection_ids)
+            archived += len(selection_ids)
+            if len(selection_ids) < self.batch_size:
+                break
+        return archived
+
+    def purge_history(self):
+        """Удаление подборов из архива старше history_days.
+
+        Returns:
+            int: Количество удаленных подборов.
+        """
+        if not self.history_days:
+            return 0
+        end_date = int(time.time() - self.history_days * SECONDS_IN_DAY)
+        purged = 0
+        while not self._stop.is_set():
+            with self.db.backend.transaction() as transaction:
+                sql_query = """DELETE FROM selections_history WHERE selection_id IN (
+                    SELECT selection_id FROM selections_history WHERE end_date < :end_date LIMIT :batch_size);
+                """
+                deleted = transaction.execute(
+                    sql_query, {"end_date": end_date, "batch_size": self.batch_size}).rowcount
+            purged += deleted
+            if deleted < self.batch_size:
+                break
+        return purged
+
+    def analyze(self):
+        """Обновление статистики для планировщика запросов."""
+        self.db.backend.analyze()
+
+    def vacuum(self):
+        """Освобождение места, занятого удаленными строками."""
+        self.db.backend.vacuum(self.batch_size, self._stop)
+
+    def _run(self):
+        """Цикл обслуживания по расписанию."""
+        last_vacuum = time.monotonic()
+        while not self._stop.wait(self.interval):
+            try:
+                self.archive_closed()
+                self.purge_history()
+                if self.api_cache:
+                    self.api_cache.purge_expired()
+                self.analyze()
+                if time.monotonic() - last_vacuum >= self.vacuum_interval:
+                    self.vacuum()
+                    last_vacuum = time.monotonic()
+            except Exception as e:
+                print(e)
@@ -1,9 +1,19 @@
 import configparser
+import signal
 
 from vk_api.bot_longpoll import VkBotEventType
 
-from selection.selection import Selection
-from vk.vk_tools import create_group_session
+from db.backends import get_backend
+from db.db_tools import SelectionDB, enable_group_commit
+from db.retention import SelectionRetention
+from monitoring.metrics import MetricsDumper, metrics, start_http_server
+from monitoring.profiling import event_profiler
+from selection.cache import SelectionCache
+from selection.candidate_index import CandidateIndexCrawler, candidate_index
+from selection.dispatcher import SelectionDispatcher
+from vk.longpoll import LongPollConsumer
+from vk.rate_limit import get_rate_limit_stats
+from vk.vk_tools import api_cache, create_group_session, create_user_session, write_message_to_vk_user
 
 config = configparser.ConfigParser()
 config.read("config.ini")
@@ -14,18 +24,192 @@ fields = config["VK"]["fields"]
 # Перед запуском заполни config.ini
 token = config["VK"]["token"]
 group_id = int(config["VK"]["group_id"])
+# Сервер, ключ и ts Long Poll, сохраняемые между перезапусками
+longpoll_state = config.get("VK", "longpoll_state", fallback="") or None
+
+# Параметры обработки сообщений
+workers = config.getint("BOT", "workers", fallback=4)
+queue_size = config.getint("BOT", "queue_size", fallback=100)
+cache_size = config.getint("BOT", "cache_size", fallback=1000)
+cache_ttl = config.getint("BOT", "cache_ttl", fallback=3600)
+
+# Параметры кэша ответов ВК
+api_cache.max_size = config.getint("CACHE", "size", fallback=10000)
+api_cache.ttls["users.get"] = config.getint(
+    "CACHE", "users_get_ttl", fallback=api_cache.ttls["users.get"])
+api_cache.ttls["photos.get"] = config.getint(
+    "CACHE", "photos_get_ttl", fallback=api_cache.ttls["photos.get"])
+api_cache_db_name = config.get("CACHE", "db_name", fallback="")
+
+# Пул соединений с сервером БД, если db_name задан URL SQLAlchemy
+db_pool_size = config.getint("DB", "pool_size", fallback=5)
+db_max_overflow = config.getint("DB", "max_overflow", fallback=10)
+
+# Групповая фиксация изменений параллельно обрабатываемых сообщений
+group_commit = config.getboolean("DB", "group_commit", fallback=False)
+group_commit_window = config.getint("DB", "group_commit_window_ms", fallback=5) / 1000
+
+# Архивация закрытых подборов
+retention = config.getboolean("RETENTION", "enabled", fallback=True)
+retention_max_age_days = config.getfloat("RETENTION", "max_age_days", fallback=30)
+retention_history_days = config.getfloat("RETENTION", "history_days", fallback=0)
+retention_batch_size = config.getint("RETENTION", "batch_size", fallback=500)
+retention_interval = config.getint("RETENTION", "interval_minutes", fallback=60) * 60
+retention_vacuum_interval = config.getint("RETENTION", "vacuum_interval_hours", fallback=24) * 3600
+
+# Локальный индекс кандидатов
+index_enabled = config.getboolean("INDEX", "enabled", fallback=False)
+candidate_index.ttl = config.getint("INDEX", "ttl_hours", fallback=24) * 3600
+index_crawler_token = config.get("INDEX", "crawler_token", fallback="")
+index_crawl_batch_size = config.getint("INDEX", "crawl_batch_size", fallback=10)
+index_crawl_interval = config.getint("INDEX", "crawl_interval_minutes", fallback=10) * 60
+
+# Метрики
+metrics_port = config.getint("METRICS", "port", fallback=0)
+metrics_host = config.get("METRICS", "host", fallback="127.0.0.1")
+metrics_dump_interval = config.getint("METRICS", "dump_interval_minutes", fallback=0) * 60
+
+# Получение событий через Callback API вместо Long Poll
+callback_enabled = config.getboolean("CALLBACK", "enabled", fallback=False)
+callback_host = config.get("CALLBACK", "host", fallback="0.0.0.0")
+callback_port = config.getint("CALLBACK", "port", fallback=8080)
+callback_path = config.get("CALLBACK", "path", fallback="/callback")
+callback_confirmation = config.get("CALLBACK", "confirmation", fallback="")
+callback_secret = config.get("CALLBACK", "secret", fallback="") or None
+callback_queue_size = config.getint("CALLBACK", "queue_size", fallback=1000)
+
+# Профилирование обработки сообщений
+event_profiler.directory = config.get("PROFILING", "directory", fallback="profiles")
+profiling_events = config.getint("PROFILING", "events", fallback=0)
+profiling_share = config.getfloat("PROFILING", "share", fallback=0.0)
+profiling_signal_events = config.getint("PROFILING", "signal_events", fallback=10)
+profiling_admin_ids = {
+    int(item) for item in config.get("PROFILING", "admin_ids", fallback="").split(",") if item.strip()}
+
+
+def process_admin_command(user_id, message_text):
+    """Обработка команды администратора.
+
+    Команды: "/profile N" - профилировать следующие N сообщений,
+    "/profile 0.1" - профилировать долю сообщений, "/profile off" - выключить.
+
+    Args:
+        user_id (int): ИД пользователя ВК.
+        message_text (str): Сообщение от пользователя.
+
+    Returns:
+        bool: Флаг обработки сообщения как команды.
+    """
+    if user_id not in profiling_admin_ids or not message_text.startswith("/profile"):
+        return False
+    argument = message_text[len("/profile"):].strip() or str(profiling_signal_events)
+    try:
+        if argument == "off":
+            event_profiler.disable()
+            answer = "Профилирование выключено."
+        elif "." in argument:
+            event_profiler.enable(share=float(argument))
+            answer = f"Профилируется доля сообщений {argument}."
+        else:
+            event_profiler.enable(events=int(argument))
+            answer = f"Профилируются следующие {argument} сообщений."
+    except ValueError:
+        answer = "Формат команды: /profile N | /profile 0.1 | /profile off"
+    write_message_to_vk_user(vk, user_id, answer)
+    return True
+
+
+def process_event(event, done):
+    """Обработка события Long Poll или Callback API.
+
+    Новые сообщения передаются в очередь обработки, остальные события
+    и команды администратора считаются обработанными сразу.
+
+    Args:
+        event (VkBotEvent): Событие Long Poll.
+        done (callable): Функция, вызываемая после обработки события.
+    """
+    if event.type != VkBotEventType.MESSAGE_NEW:
+        done()
+        return
+    message = event.obj["message"]
+    message_text = message["text"]
+    user_id = message["from_id"]
+    if process_admin_command(user_id, message_text):
+        done()
+        return
+    dispatcher.submit(user_id, message_text, done)
+
+
+def process_message(user_id, message_text):
+    """Обработка сообщения пользователя.
+
+    Args:
+        user_id (int): ИД пользователя ВК.
+        message_text (str): Сообщение от пользователя.
+    """
+    user_selection = selections.get(user_id)
+    try:
+        user_selection.processing_selection(message_text)
+    except Exception:
+        # Состояние подбора в памяти могло разойтись с БД - следующее сообщение загрузит его заново
+        selections.discard(user_id)
+        raise
+
 
 #
 if __name__ == '__main__':
     #
-    vk, longpoll = create_group_session(group_id, token)
+    get_backend(db_name, pool_size=db_pool_size, max_overflow=db_max_overflow)
+    if group_commit:
+        enable_group_commit(db_name, group_commit_window)
+    if api_cache_db_name:
+        api_cache.open_db(api_cache_db_name)
+    if retention:
+        SelectionRetention(
+            SelectionDB(db_name), retention_max_age_days, retention_history_days,
+            retention_batch_size, retention_interval, retention_vacuum_interval,
+            api_cache if api_cache_db_name else None).start()
+    if index_enabled and index_crawler_token:
+        candidate_index.open_db(db_name)
+        CandidateIndexCrawler(
+            candidate_index, create_user_session(index_crawler_token),
+            index_crawl_batch_size, index_crawl_interval).start()
+    elif index_enabled:
+        print("Индекс кандидатов не подключен: не указан crawler_token в секции [INDEX]")
+    vk, longpoll = create_group_session(group_id, token, longpoll_state=longpoll_state)
+    selections = SelectionCache(db_name, vk, fields, cache_size, cache_ttl)
+    metrics.set_gauge("selection_cache_size", lambda: len(selections))
+    # Токены с ограничением запросов, счетчики кэша ответов ВК и индекса кандидатов
+    for kind in ("group", "user"):
+        metrics.set_gauge(
+            "vk_rate_limit_tokens", lambda kind=kind: get_rate_limit_stats().get(kind, 0), kind=kind)
+    for tier in ("memory", "db"):
+        metrics.set_gauge("vk_api_cache_hits", lambda tier=tier: api_cache.get_stats()[f"{tier}_hits"], tier=tier)
+    metrics.set_gauge("vk_api_cache_misses", lambda: api_cache.get_stats()["misses"])
+    metrics.set_gauge("vk_api_cache_size", lambda: api_cache.get_stats()["size"])
+    metrics.set_gauge("candidate_index_hits", lambda: candidate_index.get_stats()["hits"])
+    metrics.set_gauge("candidate_index_misses", lambda: candidate_index.get_stats()["misses"])
+    if metrics_port:
+        start_http_server(metrics_port, metrics_host)
+    if metrics_dump_interval:
+        MetricsDumper(metrics_dump_interval).start()
+    event_profiler.enable(profiling_events, profiling_share)
+    # SIGUSR1 включает профилирование следующих сообщений, SIGUSR2 - выключает
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *args: event_profiler.enable(profiling_signal_events))
+        signal.signal(signal.SIGUSR2, lambda *args: event_profiler.disable())
+    dispatcher = SelectionDispatcher(process_message, workers, queue_size)
+    dispatcher.start()
     print("---Bot started!---")
-    while True:
-        for event in longpoll.listen():
-            if event.type == VkBotEventType.MESSAGE_NEW:
-                message = event.obj["message"]
-                message_text = message["text"]
-                user_id = message["from_id"]
-                user_selection = Selection(db_name, vk, user_id, fields)
-                user_selection.processing_selection(message_text)
-                del(user_selection)
+    if callback_enabled:
+        # aiohttp импортируется только в режиме Callback API
+        from vk.callback import CallbackServer
+        if not callback_confirmation:
+            callback_confirmation = vk.method(
+                "groups.getCallbackConfirmationCode", {"group_id": group_id})["code"]
+        CallbackServer(
+            process_event, group_id, callback_confirmation, callback_secret, callback_host,
+            callback_port, callback_path, callback_queue_size).run()
+    else:
+        LongPollConsumer(longpoll, process_event).run()
@@ -0,0 +1,311 @@
+"""Метрики работы бота в формате Prometheus.
+
+Метрики хранятся в памяти процесса. Запись значения - поиск корзины
+гистограммы и увеличение счетчиков под короткой блокировкой, поэтому
+замеры не замедляют обработку сообщений. Значения отдаются
+HTTP-сервером (`start_http_server`) или периодически выводятся в консоль
+(`MetricsDumper`).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм времени выполнения, сек
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма значений с фиксированными границами корзин.
+
+    Args:
+        buckets (tuple, optional): Верхние границы корзин по возрастанию.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Запись значения.
+
+        Args:
+            value (float): Значение.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Получение согласованной копии значений.
+
+        Returns:
+            tuple: Накопленные количества по корзинам, сумма и количество значений.
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = []
+        running = 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+def format_labels(labels):
+    """Форматирование меток метрики.
+
+    Args:
+        labels (tuple): Пары (название, значение).
+
+    Returns:
+        str: Метки в формате Prometheus.
+    """
+    if not labels:
+        return ""
+    items = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels)
+    return "{" + items + "}"
+
+
+class MetricsRegistry:
+    """Хранилище метрик процесса.
+
+    Поддерживает гистограммы, счетчики и показатели, значение
+    которых вычисляется функцией в момент выгрузки.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.descriptions = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, description):
+        """Описание метрики для вывода в HELP.
+
+        Args:
+            name (str): Название метрики.
+            description (str): Описание.
+        """
+        self.descriptions[name] = description
+
+    def observe(self, name, value, **labels):
+        """Запись значения в гистограмму.
+
+        Args:
+            name (str): Название метрики.
+            value (float): Значение.
+            labels (dict): Метки.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """Увеличение счетчика.
+
+        Args:
+            name (str): Название метрики.
+            value (float, optional): Приращение.
+            labels (dict): Метки.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, function, **labels):
+        """Регистрация показателя, вычисляемого при выгрузке.
+
+        Args:
+            name (str): Название метрики.
+            function (callable): Функция без аргументов, возвращающая значение.
+            labels (dict): Метки.
+        """
+        self.gauges[(name, tuple(sorted(labels.items())))] = function
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Замер времени выполнения блока.
+
+        Args:
+            name (str): Название метрики.
+            labels (dict): Метки.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        """Выгрузка метрик в текстовом формате Prometheus.
+
+        Returns:
+            str: Метрики.
+        """
+        lines = []
+        described = set()
+
+        def header(name, metric_type):
+            if name in described:
+                return
+            described.add(name)
+            if name in self.descriptions:
+                lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            cumulative, total, count = histogram.snapshot()
+            bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, cumulative):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), function in sorted(self.gauges.items(), key=lambda item: item[0]):
+            try:
+                value = function()
+            except Exception:
+                continue
+            header(name, "gauge")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def get_stats(self):
+        """Краткая сводка метрик для вывода в консоль.
+
+        Returns:
+            list: Строки сводки: количество, среднее время гистограмм и значения счетчиков.
+        """
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        stats = []
+        for (name, labels), histogram in histograms:
+            _, total, count = histogram.snapshot()
+            average_ms = total / count * 1000 if count else 0
+            stats.append(f"{name}{format_labels(labels)} count={count} avg={average_ms:.1f}ms")
+        for (name, labels), value in counters:
+            stats.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), function in sorted(self.gauges.items(), key=lambda item: item[0]):
+            try:
+                stats.append(f"{name}{format_labels(labels)} {function()}")
+            except Exception:
+                continue
+        return stats
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Обработчик запроса метрик по адресу /metrics."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Запросы метрик не выводятся в консоль."""
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Запуск HTTP-сервера метрик в фоновом потоке.
+
+    Args:
+        port (int): Порт.
+        host (str, optional): Адрес.
+
+    Returns:
+        ThreadingHTTPServer: Сервер.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
+
+
+class MetricsDumper:
+    """Периодический вывод сводки метрик в консоль.
+
+    Args:
+        interval (float): Период вывода, сек.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск вывода в фоновом потоке."""
+        self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка фонового потока."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        """Цикл вывода по расписанию."""
+        while not self._stop.wait(self.interval):
+            print("\n".join(["---Metrics---"] + metrics.get_stats()))
+
+
+# Метрики процесса
+metrics = MetricsRegistry()
+metrics.describe("selection_stage_seconds", "Время обработки шага подбора.")
+metrics.describe("selection_message_seconds", "Время обработки сообщения пользователя.")
+metrics.describe("selection_errors_total", "Ошибки обработки сообщений.")
+metrics.describe("vk_method_seconds", "Время вызова метода API ВК.")
+metrics.describe("vk_errors_total", "Ошибки вызова методов API ВК.")
+metrics.describe("db_query_seconds", "Время выполнения запроса на чтение к БД подбора.")
+metrics.describe("db_commit_seconds", "Время фиксации изменений в БД подбора.")
+metrics.describe("dispatcher_queue_depth", "Количество принятых, но не обработанных сообщений.")
+metrics.describe("vk_rate_limit_tokens", "Количество токенов ВК с ограничением частоты запросов.")
+metrics.describe("vk_rate_limit_throttled_total", "Запросы к API ВК, задержанные ограничением частоты.")
+metrics.describe("vk_rate_limit_retried_total", "Запросы к API ВК, повторенные после ошибок 6 и 9.")
+metrics.describe("vk_api_cache_hits", "Попадания в кэш ответов API ВК по уровням кэша.")
+metrics.describe("vk_api_cache_misses", "Промахи кэша ответов API ВК.")
+metrics.describe("vk_api_cache_size", "Количество ответов API ВК в памяти.")
+metrics.describe("candidate_index_hits", "Корзины индекса кандидатов, полученные из БД.")
+metrics.describe("candidate_index_misses", "Корзины индекса кандидатов, отсутствовавшие или устаревшие при подборе.")
+metrics.describe("longpoll_events_total", "Принятые события Long Poll.")
+metrics.describe("longpoll_duplicates_total", "Отброшенные повторы событий Long Poll.")
+metrics.describe("longpoll_history_lost_total", "Ответы Long Poll о потере истории событий.")
+metrics.describe("longpoll_errors_total", "Ошибки запроса событий Long Poll.")
+metrics.describe("longpoll_pending_events", "Количество полученных, но не обработанных событий Long Poll.")
+metrics.describe("longpoll_lag_seconds", "Возраст самого старого необработанного события Long Poll.")
+metrics.describe("callback_events_total", "Принятые события Callback API.")
+metrics.describe("callback_duplicates_total", "Отброшенные повторные отправки событий Callback API.")
+metrics.describe("callback_rejected_total", "Отклоненные запросы Callback API.")
+metrics.describe("callback_queue_depth", "Количество событий Callback API в очереди на передачу в обработку.")
+metrics.describe("callback_event_seconds", "Время от приема события Callback API до окончания его обработки.")
@@ -0,0 +1,161 @@
+"""Профилирование обработки сообщений по запросу.
+
+Профилирование включается без перезапуска бота (настройка, сигнал
+или команда администратора) на следующие N сообщений или на долю
+сообщений. Профили cProfile объединяются по меткам событий: метка
+состоит из пройденных шагов подбора и вызванных методов API ВК.
+Для каждой метки в каталог профилей записывается файл pstats,
+каждое профилированное событие добавляется строкой в events.log.
+"""
+
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ProfiledEvent:
+    """Шаги подбора и методы API ВК профилируемого события."""
+
+    def __init__(self):
+        self.stages = []
+        self.vk_methods = []
+
+    def get_tag(self):
+        """Метка события.
+
+        Returns:
+            str: Метка вида stage-3-4-5_users.search-photos.get.
+        """
+        tag = "stage-" + "-".join(str(stage_id) for stage_id in self.stages)
+        if self.vk_methods:
+            tag += "_" + "-".join(self.vk_methods)
+        return re.sub(r"[^\w.-]", "_", tag)
+
+
+class EventProfiler:
+    """Профилирование обработки выбранных сообщений.
+
+    Одновременно профилируется одно сообщение: сообщения, пришедшие
+    во время профилирования другого, обрабатываются без профиля.
+
+    Args:
+        directory (str, optional): Каталог профилей.
+    """
+
+    def __init__(self, directory="profiles"):
+        self.directory = directory
+        self.remaining = 0
+        self.share = 0.0
+        self._busy = False
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self, events=0, share=0.0):
+        """Включение профилирования.
+
+        Args:
+            events (int, optional): Количество следующих сообщений.
+            share (float, optional): Доля сообщений от 0 до 1.
+        """
+        with self._lock:
+            self.remaining = events
+            self.share = share
+
+    def disable(self):
+        """Выключение профилирования."""
+        self.enable(0, 0.0)
+
+    def _take(self):
+        """Выбор текущего сообщения для профилирования.
+
+        Returns:
+            bool: Флаг профилирования сообщения.
+        """
+        with self._lock:
+            if self._busy:
+                return False
+            if self.remaining > 0:
+                self.remaining -= 1
+            elif not (self.share and random.random() < self.share):
+                return False
+            self._busy = True
+            return True
+
+    @contextmanager
+    def profile_event(self, name):
+        """Профилирование блока обработки сообщения.
+
+        Args:
+            name (str): Название события в events.log.
+        """
+        # Без включенного профилирования блок не требует блокировок
+        if not (self.remaining or self.share) or not self._take():
+            yield
+            return
+        event = self._local.event = ProfiledEvent()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            self._local.event = None
+            try:
+                self._save(name, event, profiler, duration)
+            except Exception as e:
+                print(e)
+            finally:
+                with self._lock:
+                    self._busy = False
+
+    def record_stage(self, stage_id):
+        """Запись шага подбора профилируемого события.
+
+        Args:
+            stage_id (int): Номер шага.
+        """
+        event = getattr(self._local, "event", None)
+        if event is not None:
+            event.stages.append(stage_id)
+
+    def record_vk_method(self, method):
+        """Запись вызова метода API ВК профилируемого события.
+
+        Args:
+            method (str): Название метода API.
+        """
+        event = getattr(self._local, "event", None)
+        if event is not None and method not in event.vk_methods:
+            event.vk_methods.append(method)
+
+    def _save(self, name, event, profiler, duration):
+        """Добавление профиля события к профилю его метки и запись на диск.
+
+        Args:
+            name (str): Название события.
+            event (ProfiledEvent): Шаги и методы API события.
+            profiler (cProfile.Profile): Профиль события.
+            duration (float): Время обработки, сек.
+        """
+        tag = event.get_tag()
+        os.makedirs(self.directory, exist_ok=True)
+        stats = self._stats.get(tag)
+        if stats is None:
+            stats = self._stats[tag] = pstats.Stats(profiler)
+        else:
+            stats.add(profiler)
+        stats.dump_stats(os.path.join(self.directory, f"{tag}.pstats"))
+        with open(os.path.join(self.directory, "events.log"), "a", encoding="utf-8") as log:
+            log.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{name}\t{tag}\t{duration * 1000:.1f}ms\n")
+
+
+# Профилирование процесса, включается настройкой, сигналом или командой администратора
+event_profiler = EventProfiler()
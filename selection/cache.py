@@ -0,0 +1,81 @@
+"""Кэш активных подборов."""
+
+import threading
+import time
+from collections import OrderedDict
+
+from selection.selection import Selection
+
+
+class SelectionCache:
+    """Кэш объектов подбора в памяти процесса.
+
+    Подборы хранятся по ИД пользователя и вытесняются по давности
+    последнего обращения (LRU) и по времени жизни (TTL). Все изменения
+    подбора сразу записываются в БД, поэтому вытеснение не теряет данных:
+    при следующем сообщении подбор будет восстановлен из БД.
+
+    Args:
+        db_name (str): Путь до БД.
+        group_vk_session (object): Сессия сообщества ВК.
+        fields (list): Список полей подбора.
+        max_size (int, optional): Максимальное количество подборов в кэше.
+        ttl (int, optional): Время жизни подбора в кэше без обращений, сек.
+    """
+
+    def __init__(self, db_name, group_vk_session, fields, max_size=1000, ttl=3600):
+        self.db_name = db_name
+        self.group_vk_session = group_vk_session
+        self.fields = fields
+        self.max_size = max_size
+        self.ttl = ttl
+        self._selections = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._selections)
+
+    def get(self, user_id):
+        """Получение подбора пользователя.
+
+        Args:
+            user_id (int): ИД пользователя ВК.
+
+        Returns:
+            Selection: Подбор пользователя.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            item = self._selections.pop(user_id, None)
+            if item:
+                user_selection = item[1]
+            else:
+                user_selection = Selection(
+                    self.db_name, self.group_vk_session, user_id, self.fields)
+            self._selections[user_id] = (now, user_selection)
+            while len(self._selections) > self.max_size:
+                self._selections.popitem(last=False)
+        return user_selection
+
+    def discard(self, user_id):
+        """Удаление подбора пользователя из кэша.
+
+        Args:
+            user_id (int): ИД пользователя ВК.
+        """
+        with self._lock:
+            self._selections.pop(user_id, None)
+
+    def _evict_expired(self, now):
+        """Вытеснение подборов с истекшим временем жизни.
+
+        Args:
+            now (float): Текущее время.
+        """
+        # Подборы упорядочены по времени обращения, устаревшие - в начале
+        while self._selections:
+            user_id, (access_time, _) = next(iter(self._selections.items()))
+            if now - access_time < self.ttl:
+                break
+            del self._selections[user_id]
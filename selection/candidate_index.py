@@ -0,0 +1,246 @@
+"""Локальный индекс кандидатов подбора.
+
+Кандидаты хранятся корзинами по ИД города, полу, году рождения
+и семейному положению. Корзина заполняется одним запросом users.search
+и хранится столбцами (упакованными массивами чисел), поэтому подбор пары
+обходится без обращения к ВК, пока корзины не устарели. Корзины заполняет
+фоновый обходчик, при подборе из ВК не запрашиваются.
+"""
+
+import threading
+import time
+from array import array
+from datetime import date
+
+from db.db_tools import SelectionDB
+
+# Поля кандидатов, сохраняемые в индексе
+INDEX_FIELDS = "bdate,last_seen,has_photo"
+
+# Типы упакованных столбцов корзины
+COLUMN_TYPES = {
+    "candidate_ids": "q",
+    "birth_days": "H",
+    "last_seen": "q",
+    "has_photo": "B",
+}
+
+
+def encode_bucket(items):
+    """Упаковка кандидатов корзины в столбцы.
+
+    День рождения хранится как месяц * 32 + день, 0 - дата скрыта.
+
+    Args:
+        items (list): Пользователи из результатов поиска ВК.
+
+    Returns:
+        dict: Название столбца -> упакованный массив.
+    """
+    columns = {name: array(type_code) for name, type_code in COLUMN_TYPES.items()}
+    for item in items:
+        parts = (item.get("bdate") or "").split(".")
+        birth_day = int(parts[1]) * 32 + int(parts[0]) if len(parts) >= 2 else 0
+        columns["candidate_ids"].append(item["id"])
+        columns["birth_days"].append(birth_day)
+        columns["last_seen"].append(item.get("last_seen", {}).get("time", 0))
+        columns["has_photo"].append(item.get("has_photo", 0))
+    return {name: column.tobytes() for name, column in columns.items()}
+
+
+def decode_bucket(city_id, birth_year, columns):
+    """Распаковка кандидатов корзины в формат результатов поиска ВК.
+
+    Args:
+        city_id (int): ИД города корзины.
+        birth_year (int): Год рождения корзины.
+        columns (dict): Название столбца -> упакованный массив.
+
+    Returns:
+        list: Пользователи с полями id, bdate, city, last_seen, has_photo.
+    """
+    arrays = {}
+    for name, type_code in COLUMN_TYPES.items():
+        arrays[name] = array(type_code)
+        arrays[name].frombytes(columns[name])
+    items = []
+    for candidate_id, birth_day, last_seen, has_photo in zip(
+            arrays["candidate_ids"], arrays["birth_days"], arrays["last_seen"], arrays["has_photo"]):
+        items.append({
+            "id": candidate_id,
+            "bdate": f"{birth_day % 32}.{birth_day // 32}.{birth_year}" if birth_day else None,
+            "city": {"id": city_id},
+            "last_seen": {"time": last_seen},
+            "has_photo": has_photo,
+        })
+    return items
+
+
+class CandidateIndex:
+    """Индекс кандидатов в БД подбора.
+
+    Если для подбора не хватает корзин или какая-то из них устарела,
+    корзины запоминаются для фонового обходчика, а подбор выполняется
+    обычным поиском в ВК.
+
+    Args:
+        db_name (str, optional): Путь до БД или URL SQLAlchemy, без него индекс отключен.
+        ttl (float, optional): Время, через которое корзина считается устаревшей, сек.
+    """
+
+    def __init__(self, db_name=None, ttl=86400):
+        self.db = None
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Ключи отсутствующих и устаревших корзин, нужных при подборе
+        self._wanted = {}
+        if db_name:
+            self.open_db(db_name)
+
+    @property
+    def enabled(self):
+        """Индекс подключен к БД."""
+        return self.db is not None
+
+    def open_db(self, db_name):
+        """Подключение индекса к БД.
+
+        Args:
+            db_name (str): Путь до БД или URL SQLAlchemy.
+        """
+        self.db = SelectionDB(db_name)
+
+    def get_candidates(self, city_id, sex, age_from, age_to, relation):
+        """Получение кандидатов из индекса.
+
+        Args:
+            city_id (int): ИД города.
+            sex (int): Пол.
+            age_from (int): Возраст от.
+            age_to (int): Возраст до.
+            relation (int): Семейное положение.
+
+        Returns:
+            list: Пользователи в формате результатов поиска ВК или None,
+                если нужных корзин нет в индексе или они устарели.
+        """
+        current_year = date.today().year
+        birth_years = range(current_year - age_to - 1, current_year - age_from + 1)
+        buckets = {row[0]: row for row in self.db.get_index_buckets(
+            city_id, sex, birth_years[0], birth_years[-1], relation)}
+        update_date = time.time() - self.ttl
+        missing = [birth_year for birth_year in birth_years
+                   if birth_year not in buckets or buckets[birth_year][6] < update_date]
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(birth_years) - len(missing)
+            for birth_year in missing:
+                self._wanted[(city_id, sex, birth_year, relation)] = None
+        if missing:
+            return None
+        items = []
+        for birth_year in birth_years:
+            items.extend(decode_bucket(
+                city_id, birth_year, dict(zip(COLUMN_TYPES, buckets[birth_year][1:5]))))
+        return items
+
+    def refresh_bucket(self, vk_session, city_id, sex, birth_year, relation):
+        """Загрузка корзины из ВК и запись в индекс.
+
+        Args:
+            vk_session (object): Сессия пользователя ВК.
+            city_id (int): ИД города.
+            sex (int): Пол.
+            birth_year (int): Год рождения.
+            relation (int): Семейное положение.
+
+        Returns:
+            list: Пользователи в формате результатов поиска ВК.
+        """
+        search_result = vk_session.method("users.search", {
+            "q": "", "count": 1000, "fields": INDEX_FIELDS, "city": city_id, "sex": sex,
+            "birth_year": birth_year, "status": relation})
+        columns = encode_bucket(search_result.get("items", []))
+        self.db.set_index_bucket(
+            city_id, sex, birth_year, relation, columns, search_result.get("count", 0))
+        return decode_bucket(city_id, birth_year, columns)
+
+    def refresh_buckets(self, vk_session, limit=10):
+        """Загрузка корзин, нужных при подборе, затем обновление самых старых устаревших.
+
+        Args:
+            vk_session (object): Сессия пользователя ВК.
+            limit (int, optional): Количество корзин.
+
+        Returns:
+            int: Количество обновленных корзин.
+        """
+        with self._lock:
+            buckets = list(self._wanted)[:limit]
+            for key in buckets:
+                del self._wanted[key]
+        if len(buckets) < limit:
+            stale_buckets = self.db.get_stale_index_buckets(int(time.time() - self.ttl), limit)
+            buckets.extend(key for key in stale_buckets if key not in buckets)
+            buckets = buckets[:limit]
+        for city_id, sex, birth_year, relation in buckets:
+            self.refresh_bucket(vk_session, city_id, sex, birth_year, relation)
+        return len(buckets)
+
+    def get_stats(self):
+        """Статистика обращений к индексу.
+
+        Returns:
+            dict: Количество попаданий и промахов.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+class CandidateIndexCrawler:
+    """Фоновое заполнение и обновление корзин индекса кандидатов.
+
+    Сначала загружаются корзины, которых не хватило при подборе, затем
+    обновляются устаревшие. Корзины обновляются небольшими порциями,
+    поэтому запросы обходчика не расходуют весь лимит запросов токена.
+
+    Args:
+        index (CandidateIndex): Индекс кандидатов.
+        vk_session (object): Сессия пользователя ВК обходчика.
+        batch_size (int, optional): Количество корзин за один проход.
+        interval (float, optional): Период обхода, сек.
+    """
+
+    def __init__(self, index, vk_session, batch_size=10, interval=600):
+        self.index = index
+        self.vk_session = vk_session
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск обхода в фоновом потоке."""
+        self._thread = threading.Thread(target=self._run, name="candidate-index-crawler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка фонового потока."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        """Цикл обхода по расписанию."""
+        while not self._stop.is_set():
+            try:
+                self.index.refresh_buckets(self.vk_session, self.batch_size)
+            except Exception as e:
+                print(e)
+            self._stop.wait(self.interval)
+
+
+# Индекс кандидатов процесса, подключается к БД при запуске бота
+candidate_index = CandidateIndex()
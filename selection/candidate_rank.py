@@ -0,0 +1,160 @@
+"""Ранжирование кандидатов подбора по нескольким критериям."""
+
+import math
+import time
+from datetime import date
+
+# Дополнительные поля кандидатов в результатах поиска
+SEARCH_FIELDS = "bdate,city,interests,last_seen,common_count,has_photo"
+
+# Веса признаков кандидата по умолчанию
+DEFAULT_WEIGHTS = {
+    "age": 1.0,
+    "city": 3.0,
+    "activity": 2.0,
+    "photo": 1.0,
+    "common": 1.0,
+    "interests": 0.5,
+}
+
+SECONDS_IN_DAY = 86400
+
+# NumPy загружается при первом векторном расчете, а не при запуске
+_numpy = None
+
+
+def get_numpy():
+    """Загрузка NumPy при первом обращении.
+
+    Returns:
+        module: Модуль numpy или None, если NumPy не установлен.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def get_age(bdate, today=None):
+    """Возраст по дате рождения из ВК.
+
+    Args:
+        bdate (str): Дата рождения в формате D.M.YYYY или D.M.
+        today (date, optional): Текущая дата.
+
+    Returns:
+        int: Возраст или None, если год рождения скрыт.
+    """
+    parts = (bdate or "").split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        day, month, year = map(int, parts)
+    except ValueError:
+        return None
+    today = today or date.today()
+    return today.year - year - ((today.month, today.day) < (month, day))
+
+
+def get_interests(interests):
+    """Множество интересов из текста профиля ВК.
+
+    Args:
+        interests (str): Интересы через ",".
+
+    Returns:
+        frozenset: Интересы в нижнем регистре.
+    """
+    return frozenset(
+        item.strip().lower() for item in (interests or "").split(",") if item.strip())
+
+
+def get_candidate_features(items, pair_info, now=None):
+    """Получение признаков кандидатов по столбцам.
+
+    Args:
+        items (list): Пользователи из результатов поиска ВК.
+        pair_info (dict): Параметры искомой пары (age, city_id, interests).
+        now (float, optional): Текущее время, сек.
+
+    Returns:
+        dict: Название признака -> значения признака кандидатов,
+            None - разница в возрасте неизвестна.
+    """
+    now = now or time.time()
+    today = date.today()
+    pair_age = pair_info.get("age")
+    city_id = pair_info.get("city_id")
+    pair_interests = get_interests(pair_info.get("interests"))
+
+    ages = [get_age(item.get("bdate"), today) for item in items]
+    last_seen = [item.get("last_seen", {}).get("time") for item in items]
+    return {
+        "age": [None if age is None or pair_age is None else -abs(age - pair_age) for age in ages],
+        "city": [float(bool(city_id) and item.get("city", {}).get("id") == city_id) for item in items],
+        "activity": [0.0 if not seen else 1 / (1 + max(now - seen, 0) / SECONDS_IN_DAY)
+                     for seen in last_seen],
+        "photo": [float(item.get("has_photo", 0)) for item in items],
+        "common": [math.log1p(item.get("common_count", 0)) for item in items],
+        "interests": [float(len(get_interests(item.get("interests")) & pair_interests))
+                      if pair_interests else 0.0 for item in items],
+    }
+
+
+def rank_candidates(items, pair_info, weights=None, now=None):
+    """Упорядочивание кандидатов по убыванию оценки.
+
+    Неизвестная разница в возрасте (год рождения скрыт) заменяется
+    наибольшей разницей среди остальных кандидатов.
+    При равной оценке сохраняется порядок результатов поиска.
+
+    Args:
+        items (list): Пользователи из результатов поиска ВК.
+        pair_info (dict): Параметры искомой пары (age, city_id, interests).
+        weights (dict, optional): Веса признаков.
+        now (float, optional): Текущее время, сек.
+
+    Returns:
+        list: ИД кандидатов.
+    """
+    if not items:
+        return []
+    weights = weights or DEFAULT_WEIGHTS
+    features = get_candidate_features(items, pair_info, now)
+    if get_numpy() is not None:
+        return _rank_candidates_vectorized(items, features, weights)
+    worst_age = min((age for age in features["age"] if age is not None), default=0)
+    features["age"] = [worst_age if age is None else age for age in features["age"]]
+    scores = [0.0] * len(items)
+    for name, weight in weights.items():
+        scores = [score + value * weight for score, value in zip(scores, features[name])]
+    order = sorted(range(len(items)), key=lambda index: -scores[index])
+    return [items[index]["id"] for index in order]
+
+
+def _rank_candidates_vectorized(items, features, weights):
+    """Расчет оценок всех кандидатов одним матричным умножением.
+
+    Args:
+        items (list): Пользователи из результатов поиска ВК.
+        features (dict): Признаки кандидатов по столбцам.
+        weights (dict): Веса признаков.
+
+    Returns:
+        list: ИД кандидатов.
+    """
+    np = get_numpy()
+    names = list(weights)
+    matrix = np.array([features[name] for name in names], dtype=float).T
+    if "age" in weights:
+        ages = matrix[:, names.index("age")]
+        known = ~np.isnan(ages)
+        ages[~known] = ages[known].min() if known.any() else 0
+    scores = matrix @ np.array([weights[name] for name in names], dtype=float)
+    order = np.argsort(-scores, kind="stable")
+    ids = np.fromiter((item["id"] for item in items), dtype=np.int64, count=len(items))
+    return ids[order].tolist()
@@ -0,0 +1,132 @@
+"""Очередь кандидатов подбора."""
+
+import json
+from selection.candidate_index import candidate_index
+from selection.candidate_rank import SEARCH_FIELDS, rank_candidates
+from vk.vk_tools import search_vk_users_items
+
+
+class CandidateQueue:
+    """Очередь кандидатов, заполняемая результатами поиска ВК.
+
+    Очередь хранится в БД вместе с подбором, поэтому следующие пары
+    выдаются без обращения к ВК. Список кандидатов записывается один раз
+    при заполнении, при выдаче кандидата записывается только позиция. Результаты поиска запрашиваются одной
+    страницей, так как кандидаты упорядочиваются по оценке `rank_candidates`
+    все вместе. Если известен ИД города пары и в индексе кандидатов есть
+    свежие корзины для подбора, очередь заполняется из индекса без поиска в ВК.
+
+    Args:
+        db (SelectionDB): БД подбора.
+        selection_id (str): ИД подбора.
+        vk_session (object): Сессия пользователя ВК.
+        add_fields (dict): Поля поиска.
+        pair_info (dict, optional): Параметры искомой пары (age, city_id, interests).
+    """
+
+    # ВК возвращает не более 1000 результатов поиска
+    MAX_RESULTS = 1000
+
+    def __init__(self, db, selection_id, vk_session, add_fields, pair_info=None):
+        self.db = db
+        self.selection_id = selection_id
+        self.vk_session = vk_session
+        self.add_fields = add_fields
+        self.pair_info = pair_info
+        self.search_params = json.dumps(add_fields, sort_keys=True, ensure_ascii=False)
+        self.candidate_ids = []
+        self.position = 0
+        self.search_offset = 0
+        self.search_count = None
+        # Позиция, записанная в БД
+        self._saved_position = 0
+
+        candidate_queue = db.get_candidate_queue(selection_id)
+        if candidate_queue and candidate_queue[0] == self.search_params:
+            self.candidate_ids = json.loads(candidate_queue[1])
+            self.search_offset = candidate_queue[2]
+            self.search_count = candidate_queue[3]
+            self.position = self._saved_position = candidate_queue[4]
+
+    @property
+    def exhausted(self):
+        """Все доступные результаты поиска получены."""
+        return (self.search_count is not None
+                and self.search_offset >= min(self.search_count, self.MAX_RESULTS))
+
+    def pop(self, shown_user_ids):
+        """Получение следующего кандидата.
+
+        Args:
+            shown_user_ids (set): Множество ИД ранее показанных пользователей.
+
+        Returns:
+            int: Идентификатор кандидата или -1, если кандидатов не осталось.
+        """
+        if self.position >= len(self.candidate_ids) and not self.exhausted:
+            self._refill()
+        pair_user_id = -1
+        while self.position < len(self.candidate_ids):
+            candidate_id = self.candidate_ids[self.position]
+            self.position += 1
+            if candidate_id not in shown_user_ids:
+                pair_user_id = candidate_id
+                break
+        self.save()
+        return pair_user_id
+
+    def save(self):
+        """Запись позиции следующего кандидата в БД."""
+        if self.position == self._saved_position:
+            return
+        self.db.set_candidate_position(self.selection_id, self.position)
+        self._saved_position = self.position
+
+    def _refill(self):
+        """Загрузка результатов поиска."""
+        if (candidate_index.enabled and self.pair_info and self.pair_info.get("city_id")
+                and self._refill_from_index()):
+            return
+        if self.pair_info is None:
+            items, search_count = search_vk_users_items(
+                self.vk_session, self.add_fields, 0, self.MAX_RESULTS)
+            user_ids = [item["id"] for item in items]
+        else:
+            items, search_count = search_vk_users_items(
+                self.vk_session, self.add_fields, 0, self.MAX_RESULTS, SEARCH_FIELDS)
+            user_ids = rank_candidates(items, self.pair_info)
+        # Пустой результат означает, что кандидатов нет
+        self._store(user_ids, search_count if user_ids else 0, self.MAX_RESULTS)
+
+    def _refill_from_index(self):
+        """Заполнение очереди всеми кандидатами из индекса.
+
+        Returns:
+            bool: Очередь заполнена, False - нужных корзин в индексе нет.
+        """
+        items = candidate_index.get_candidates(
+            self.pair_info["city_id"], self.add_fields["sex"],
+            self.add_fields["age_from"], self.add_fields["age_to"], self.add_fields["status"])
+        if items is None:
+            return False
+        # Кандидат попадает в несколько корзин, если сменил данные профиля между обновлениями
+        user_ids = list(dict.fromkeys(rank_candidates(items, self.pair_info)))
+        # Индекс возвращает всех кандидатов сразу
+        self._store(user_ids, len(user_ids), len(user_ids) or 1)
+        return True
+
+    def _store(self, user_ids, search_count, search_offset):
+        """Запись нового списка кандидатов в очередь и в БД.
+
+        Args:
+            user_ids (list): ИД кандидатов в порядке выдачи.
+            search_count (int): Количество результатов поиска.
+            search_offset (int): Смещение следующей страницы результатов.
+        """
+        self.candidate_ids = user_ids
+        self.position = self._saved_position = 0
+        self.search_count = search_count
+        self.search_offset = search_offset
+        self.db.set_candidate_queue(
+            self.selection_id, self.search_params, json.dumps(user_ids),
+            search_offset, search_count)
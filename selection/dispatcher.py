@@ -0,0 +1,107 @@
+"""Параллельная обработка сообщений пользователей."""
+
+import threading
+from collections import deque
+from queue import Queue
+
+from monitoring.metrics import metrics
+
+
+class SelectionDispatcher:
+    """Диспетчер обработки сообщений на пуле потоков.
+
+    Сообщения разных пользователей обрабатываются параллельно,
+    сообщения одного пользователя - строго в порядке поступления.
+    Количество принятых, но еще не обработанных сообщений ограничено:
+    при заполнении очереди `submit` блокируется до освобождения места.
+
+    Args:
+        handler (callable): Обработчик сообщения handler(user_id, message_text).
+        workers (int, optional): Количество потоков обработки.
+        queue_size (int, optional): Максимальное количество сообщений в очереди.
+    """
+
+    def __init__(self, handler, workers=4, queue_size=100):
+        self.handler = handler
+        self.workers = workers
+        self.queue = Queue()
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        # Количество принятых, но еще не обработанных сообщений
+        self.depth = 0
+        # Сообщения пользователей, которые сейчас обрабатываются другим потоком
+        self._pending = {}
+        self._threads = []
+
+    def start(self):
+        """Запуск потоков обработки."""
+        metrics.set_gauge("dispatcher_queue_depth", lambda: self.depth)
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"selection-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Остановка потоков обработки после разбора очереди."""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, user_id, message_text, callback=None):
+        """Постановка сообщения в очередь обработки.
+
+        Args:
+            user_id (int): ИД пользователя ВК.
+            message_text (str): Сообщение от пользователя.
+            callback (callable, optional): Функция без аргументов, вызываемая
+                после обработки сообщения, в том числе завершившейся ошибкой.
+        """
+        self._slots.acquire()
+        with self._lock:
+            self.depth += 1
+        self.queue.put((user_id, message_text, callback))
+
+    def _worker(self):
+        """Цикл потока обработки."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            user_id, message_text, callback = item
+            with self._lock:
+                if user_id in self._pending:
+                    # Пользователь уже обрабатывается - сообщение заберет тот же поток
+                    self._pending[user_id].append((message_text, callback))
+                    continue
+                self._pending[user_id] = deque()
+            while True:
+                self._handle(user_id, message_text, callback)
+                with self._lock:
+                    if self._pending[user_id]:
+                        message_text, callback = self._pending[user_id].popleft()
+                    else:
+                        del self._pending[user_id]
+                        break
+
+    def _handle(self, user_id, message_text, callback=None):
+        """Обработка одного сообщения.
+
+        Args:
+            user_id (int): ИД пользователя ВК.
+            message_text (str): Сообщение от пользователя.
+            callback (callable, optional): Функция, вызываемая после обработки.
+        """
+        try:
+            self.handler(user_id, message_text)
+        except Exception as e:
+            metrics.inc("selection_errors_total", error=type(e).__name__)
+            print(e)
+        finally:
+            with self._lock:
+                self.depth -= 1
+            self._slots.release()
+            if callback is not None:
+                callback()
@@ -1,11 +1,23 @@
 """Алгоритм подбора."""
-import json
+import time
 from datetime import date, datetime
 
 from db.db_tools import SelectionDB
-from vk.vk_tools import (create_user_session, get_vk_user_3_foto_attachment_value, get_vk_user_3_foto_url,
-                         get_vk_user_info, get_vk_user_link, search_vk_user,
-                         select_pair, write_message_to_vk_user)
+from monitoring.metrics import metrics
+from monitoring.profiling import event_profiler
+from selection.candidates import CandidateQueue
+from vk.outbox import VkOutbox
+from vk.vk_tools import (VkApiBatch, create_user_session, get_vk_user_3_foto_attachment_value,
+                         get_vk_user_3_foto_url, get_vk_user_info, get_vk_user_link,
+                         search_vk_user_info, write_message_to_vk_user)
+
+# Допустимая разница в возрасте кандидатов, лет: более близкие по возрасту
+# кандидаты получают более высокую оценку
+AGE_RANGE = 2
+
+# Поля целевого пользователя, которые не обязательны для подбора,
+# но используются при ранжировании кандидатов
+RANK_FIELDS = ["interests"]
 
 
 def calculate_years(start_dt, end_dt):
@@ -35,6 +47,7 @@ class Selection:
     def __init__(self, db_name, group_vk_session, user_id, fields) -> None:
         self.db = SelectionDB(db_name)
         self.group_vk_session = group_vk_session
+        self.group_vk_outbox = None
 
         self.user_id = user_id
         self.user_token = None
@@ -42,6 +55,7 @@ class Selection:
 
         self.selection_id = None
         self.stage_id = None
+        self.saved_stage_id = None
         self.fields = fields
 
         self.target_user_id = None
@@ -49,6 +63,22 @@ class Selection:
 
         self.pair_user_info = {}
         self.pair_user_id = None
+        self.shown_user_ids = None
+        self.candidate_queue = None
+
+    def write_message(self, answer, attachment=""):
+        """Отправка сообщения пользователю.
+
+        Во время обработки сообщения ответы накапливаются, объединяются
+        в как можно меньшее количество сообщений и отправляются одним
+        запросом в конце обработки.
+
+        Args:
+            answer (str): Сообщение пользователю.
+            attachment (str, optional): Перечень вложений через ",".
+        """
+        vk_session = self.group_vk_outbox or self.group_vk_session
+        write_message_to_vk_user(vk_session, self.user_id, answer, attachment)
 
     def stage_0_write_hello_message(self, next_stage=True):
         """Шаг 0. Вывод приветствия.
@@ -57,7 +87,7 @@ class Selection:
             next_stage (bool, optional): Флаг необходимости перехода к следующему шагу.
         """
         answer = "Я бот подбора партнера. Приступим к подбору?(да/нет)"
-        write_message_to_vk_user(self.group_vk_session, self.user_id, answer)
+        self.write_message(answer)
         if next_stage:
             self.next_stage()
 
@@ -68,7 +98,7 @@ class Selection:
             next_stage (bool, optional): Флаг необходимости перехода к следующему шагу.
         """
         answer = "Введите токен пользователя VK от имени которого будет производиться подбор."
-        write_message_to_vk_user(self.group_vk_session, self.user_id, answer)
+        self.write_message(answer)
         if next_stage:
             self.next_stage()
 
@@ -79,7 +109,7 @@ class Selection:
             next_stage (bool, optional): Флаг необходимости перехода к следующему шагу.
         """
         answer = "Введите имя пользователя или его id в ВК, для которого мы ищем пару."
-        write_message_to_vk_user(self.group_vk_session, self.user_id, answer)
+        self.write_message(answer)
         if next_stage:
             self.next_stage()
 
@@ -92,7 +122,7 @@ class Selection:
 
         answer = f"""Целевой пользователь найден!
         {get_vk_user_link(self.target_user_id)}"""
-        write_message_to_vk_user(self.group_vk_session, self.user_id, answer)
+        self.write_message(answer)
         if next_stage:
             self.next_stage()
 
@@ -103,7 +133,7 @@ class Selection:
             next_stage (bool, optional): Флаг необходимости перехода к следующему шагу.
         """
         answer = "Поиск пары"
-        write_message_to_vk_user(self.group_vk_session, self.user_id, answer)
+        self.write_message(answer)
         if next_stage:
             self.next_stage()
 
@@ -114,58 +144,110 @@ class Selection:
             data (str): Наименование поля с данными.
         """
         answer = f"Для подбора не хватает данных. Введите {data}"
-        write_message_to_vk_user(self.group_vk_session, self.user_id, answer)
+        self.write_message(answer)
 
     def create_new_selection(self):
         """Создание новой записи о подборе в БД.
         """
-        self.db.create_selection(self.user_id)
-        self.selection_id = self.db.get_active_selection_id(self.user_id)
-        self.stage_id = self.db.get_stage_id(self.selection_id)
+        self.get_exist_selection(self.db.create_selection(self.user_id))
+
+    def get_exist_selection(self, selection):
+        """Восстановление подбора из записи БД.
 
-    def get_exist_selection(self):
-        """Восстановление существующего подбора из БД.
+        Args:
+            selection (SelectionRecord): Запись о подборе.
         """
-        self.selection_id = self.db.get_active_selection_id(self.user_id)
-        selection_info = self.db.get_selection(self.selection_id)
-        self.user_id = selection_info[0]
-        self.stage_id = selection_info[5]
-        self.target_user_id = selection_info[2]
-        if selection_info[3]:
-            target_user_info = selection_info[3]
-            target_user_info = target_user_info.replace("'", '"')
-            target_user_info = target_user_info.replace("True", "true")
-            target_user_info = target_user_info.replace("False", "false")
-            target_user_info = json.loads(target_user_info)
-            self.target_user_info = target_user_info
-        elif self.target_user_id:
-            self.target_user_info = get_vk_user_info(
-                self.user_vk_session, self.target_user_id, self.fields)
-        self.user_token = selection_info[1]
-        self.pair_user_id = selection_info[-1]
+        self.selection_id = selection.selection_id
+        self.user_id = selection.vk_user_id
+        self.stage_id = selection.stage_id
+        self.saved_stage_id = selection.stage_id
+        self.target_user_id = selection.vk_target_id
+        self.user_token = selection.vk_user_token
+        self.pair_user_id = selection.result_vk_user_id
         if self.user_token:
             self.user_vk_session = create_user_session(self.user_token)
+        if selection.vk_target_info:
+            self.target_user_info = selection.vk_target_info
+        elif self.target_user_id:
+            self.target_user_info = self.project_target_info(get_vk_user_info(
+                self.user_vk_session, self.target_user_id, self.get_target_fields()))
 
     def get_selection(self):
         """Получение подбора.
+
+        Загруженный ранее подбор берется из памяти без обращения к БД,
+        иначе активный подбор загружается одним запросом.
         """
-        is_new_selection = not self.db.active_selection_exists(self.user_id)
-        if is_new_selection:
+        if self.selection_id:
+            return
+        selection = self.db.load_active_selection(self.user_id)
+        if selection is None:
             self.create_new_selection()
         else:
-            self.get_exist_selection()
+            self.get_exist_selection(selection)
 
     def next_stage(self):
         """Переход к следующему шагу подбора.
+
+        Шаг записывается в БД один раз в конце обработки сообщения.
+        """
+        self.stage_id += 1
+
+    def save_stage(self):
+        """Запись шага подбора, если он изменился при обработке сообщения.
+        """
+        if self.selection_id and self.stage_id != self.saved_stage_id:
+            self.db.set_stage_id(self.selection_id, self.stage_id)
+            self.saved_stage_id = self.stage_id
+
+    def reset_selection(self):
+        """Сброс состояния завершенного подбора.
+        """
+        self.user_token = None
+        self.user_vk_session = None
+        self.selection_id = None
+        self.stage_id = None
+        self.saved_stage_id = None
+        self.target_user_id = None
+        self.target_user_info = {}
+        self.pair_user_info = {}
+        self.pair_user_id = None
+        self.shown_user_ids = None
+        self.candidate_queue = None
+
+    def get_candidate_queue(self, add_fields, pair_info=None):
+        """Получение очереди кандидатов подбора.
+
+        Args:
+            add_fields (dict): Поля поиска.
+            pair_info (dict, optional): Параметры искомой пары для ранжирования кандидатов.
+
+        Returns:
+            CandidateQueue: Очередь кандидатов.
         """
-        self.db.next_stage(self.selection_id)
+        if self.candidate_queue is None or self.candidate_queue.add_fields != add_fields:
+            self.candidate_queue = CandidateQueue(
+                self.db, self.selection_id, self.user_vk_session, add_fields, pair_info)
+        return self.candidate_queue
+
+    def get_shown_user_ids(self):
+        """Получение списка показанных ранее результатов подбора.
+
+        Returns:
+            set: Множество ИД показанных пользователей.
+        """
+        if self.shown_user_ids is None:
+            self.shown_user_ids = set(self.db.get_shown_user_ids(
+                self.user_id, self.target_user_id))
+        return self.shown_user_ids
 
     def close_selection(self):
         """Завершение подбора без результата.
         """
         answer = "Подбор завершен. Спасибо."
-        write_message_to_vk_user(self.group_vk_session, self.user_id, answer)
+        self.write_message(answer)
         self.db.close_seletion(self.selection_id)
+        self.reset_selection()
 
     def complete_selection(self):
         """Завершение подбора с выводом результата.
@@ -179,18 +261,38 @@ class Selection:
                 self.user_vk_session, self.pair_user_id)
             answer = f"""Подобрана пара:
             {pair_user_url}"""
-            write_message_to_vk_user(
-            self.group_vk_session, self.user_id, answer, attachment)
+            self.write_message(answer, attachment)
             self.db.add_user_id_to_shown(self.selection_id, self.pair_user_id)
+            self.get_shown_user_ids().add(self.pair_user_id)
             answer = "Искать дальше?(да/нет)"
-            write_message_to_vk_user(
-                self.group_vk_session, self.user_id, answer)
+            self.write_message(answer)
         else:
             answer = "К сожалению, не удалось подобрать пару."
-            write_message_to_vk_user(
-                self.group_vk_session, self.user_id, answer)
+            self.write_message(answer)
             self.close_selection()
 
+    def get_target_fields(self):
+        """Получение полей, запрашиваемых для целевого пользователя.
+
+        Returns:
+            str: Поля подбора и поля ранжирования через ",".
+        """
+        fields = self.fields.split(",")
+        return ",".join(fields + [field for field in RANK_FIELDS if field not in fields])
+
+    def project_target_info(self, target_user_info):
+        """Отбор полей целевого пользователя, необходимых для подбора.
+
+        Args:
+            target_user_info (dict): Информация о пользователе из ВК.
+
+        Returns:
+            dict: Информация только с ИД, именем, полями подбора и ранжирования.
+        """
+        required_fields = ["id", "first_name", "last_name"] + self.get_target_fields().split(",")
+        return {key: value for key, value in target_user_info.items()
+                if key in required_fields}
+
     def required_data_out(self):
         """Получение списка отсутствующих полей.
 
@@ -216,105 +318,187 @@ class Selection:
         Args:
             message_text (str, optional): Сообщение от пользоваателя.
         """
+        with event_profiler.profile_event(f"user {self.user_id}"):
+            start = time.perf_counter()
+            group_vk_batch = VkApiBatch(self.group_vk_session)
+            self.group_vk_outbox = VkOutbox(group_vk_batch)
+            try:
+                # Изменения подбора фиксируются одной транзакцией до отправки ответов.
+                # Если обработка или фиксация завершилась ошибкой, ответы не отправляются:
+                # они описывают переход, которого нет в БД
+                with self.db.unit_of_work():
+                    self.process_stage(message_text)
+                    self.save_stage()
+                with group_vk_batch:
+                    self.group_vk_outbox.flush()
+            finally:
+                self.group_vk_outbox = None
+                metrics.observe("selection_message_seconds", time.perf_counter() - start)
+
+    def process_stage(self, message_text=None):
+        """Обработка сообщения обработчиками шагов подбора.
+
+        Подбор загружается один раз, переходы между шагами
+        выполняются в памяти без повторной загрузки.
 
+        Args:
+            message_text (str, optional): Сообщение от пользоваателя.
+        """
         self.get_selection()
+        while True:
+            stage_id = self.stage_id
+            handler = self.STAGE_HANDLERS.get(stage_id)
+            if handler is None:
+                break
+            event_profiler.record_stage(stage_id)
+            start = time.perf_counter()
+            next_stage = handler(self, message_text)
+            metrics.observe("selection_stage_seconds", time.perf_counter() - start, stage=stage_id)
+            if not next_stage:
+                break
+            # Следующий шаг обрабатывается в том же сообщении без текста
+            message_text = None
+
+    def handle_stage_0(self, message_text):
+        """Приветствие и запрос начала работы.
 
-        # Обработка необходимого шага подбора
-        # Приветствие и запрос начала работы
-        if self.stage_id == 0:
-            self.stage_0_write_hello_message()
-        # Запрос токена
-        if self.stage_id == 1:
-            message_text.lower()
-            if message_text == "да":
-                self.stage_1_get_user_token()
-            elif message_text == "нет":
-                self.close_selection()
-            else:
-                self.stage_0_write_hello_message(next_stage=False)
-        # Запрос пользователя
-        elif self.stage_id == 2:
-            user_token = message_text
-            try:
-                user_vk_session = create_user_session(user_token)
-                get_vk_user_info(user_vk_session, self.user_id)
-                self.db.set_vk_user_token(self.selection_id, user_token)
-                self.stage_2_get_target_user_id()
-            except Exception as e:
-                print(e)
-                self.stage_1_get_user_token(next_stage=False)
-        # Поиск целевого пользователя
-        elif self.stage_id == 3:
-            target_user = message_text
-            if target_user:
-                target_user_id = search_vk_user(
-                    self.user_vk_session, target_user)
-                if target_user_id:
-                    self.target_user_id = target_user_id
-                    self.target_user_info = get_vk_user_info(
-                        self.user_vk_session, self.target_user_id, self.fields)
-                    self.db.set_target_user_id(
-                        self.selection_id, self.target_user_id)
-                    self.db.set_target_user_info(
-                        self.selection_id, self.target_user_info)
-                    self.stage_3_get_target_user_info()
-                    self.processing_selection()
-                else:
-                    self.stage_2_get_target_user_id(next_stage=False)
-            else:
-                self.stage_2_get_target_user_id(next_stage=False)
-        # Проверяем полноту данных
-        elif self.stage_id == 4:
-            if not self.required_data_out():
-                self.stage_4_get_pair()
-                self.processing_selection()
-            elif not message_text:
-                data = self.required_data_out()[0]
-                self.get_data_from_user(data)
-            elif message_text:
-                data = self.required_data_out()[0]
-                self.target_user_info[data] = message_text
-                self.db.set_target_user_info(
-                    self.selection_id, self.target_user_info)
-                self.processing_selection()
-        # Ищем пару
-        elif self.stage_id == 5:
-            shown_user_ids_list = self.db.get_shown_user_ids(
-                self.user_id, self.target_user_id)
-            if message_text == "нет":
-                self.close_selection()
-            else:    
-                if not self.pair_user_id or self.pair_user_id in shown_user_ids_list:
-                    # Расчет доп параметров
-                    # Название города пары
-                    if isinstance(self.target_user_info["city"], dict):
-                        self.pair_user_info["hometown"] = self.target_user_info["city"]["title"]
-                    else:
-                        self.pair_user_info["hometown"] = self.target_user_info["city"]
-                    # Возраст пары
-                    a_date = datetime.strptime(
-                        self.target_user_info["bdate"], "%d.%m.%Y").date()
-                    b_date = date.today()
-                    age = calculate_years(a_date, b_date)
-                    self.pair_user_info["age"] = age
-                    # Пол пары
-                    self.pair_user_info["sex"] = 0
-                    if self.target_user_info["sex"] == 1:
-                        self.pair_user_info["sex"] = 2
-                    elif self.target_user_info["sex"] == 2:
-                        self.pair_user_info["sex"] = 1
-
-                    add_fields = {
-                        "hometown": self.pair_user_info["hometown"],
-                        "age_from": self.pair_user_info["age"],
-                        "age_to": self.pair_user_info["age"],
-                        "sex": self.pair_user_info["sex"],
-                        "status": 6,
-                    }
-                    self.pair_user_id = select_pair(
-                        self.user_vk_session, add_fields, shown_user_ids_list)
-                    self.db.set_result_vk_user_id(
-                        self.selection_id, self.pair_user_id)
-                    self.processing_selection()
-                else:
-                    self.complete_selection()
+        Returns:
+            bool: Флаг продолжения обработки следующим шагом.
+        """
+        self.stage_0_write_hello_message()
+        return False
+
+    def handle_stage_1(self, message_text):
+        """Запрос токена.
+
+        Returns:
+            bool: Флаг продолжения обработки следующим шагом.
+        """
+        if message_text == "да":
+            self.stage_1_get_user_token()
+        elif message_text == "нет":
+            self.close_selection()
+        else:
+            self.stage_0_write_hello_message(next_stage=False)
+        return False
+
+    def handle_stage_2(self, message_text):
+        """Проверка токена и запрос целевого пользователя.
+
+        Returns:
+            bool: Флаг продолжения обработки следующим шагом.
+        """
+        user_token = message_text
+        try:
+            user_vk_session = create_user_session(user_token)
+            # Проверка токена не должна использовать кэш ответов
+            get_vk_user_info(user_vk_session, self.user_id, use_cache=False)
+            self.db.set_vk_user_token(self.selection_id, user_token)
+            self.user_token = user_token
+            self.user_vk_session = user_vk_session
+            self.stage_2_get_target_user_id()
+        except Exception as e:
+            metrics.inc("selection_errors_total", error=type(e).__name__, stage=2)
+            print(e)
+            self.stage_1_get_user_token(next_stage=False)
+        return False
+
+    def handle_stage_3(self, message_text):
+        """Поиск целевого пользователя.
+
+        Returns:
+            bool: Флаг продолжения обработки следующим шагом.
+        """
+        target_user_info = None
+        if message_text:
+            target_user_info = search_vk_user_info(
+                self.user_vk_session, message_text, self.get_target_fields())
+        if not target_user_info:
+            self.stage_2_get_target_user_id(next_stage=False)
+            return False
+        self.target_user_id = target_user_info["id"]
+        self.shown_user_ids = None
+        self.target_user_info = self.project_target_info(target_user_info)
+        self.db.set_target_user(
+            self.selection_id, self.target_user_id, self.target_user_info)
+        self.stage_3_get_target_user_info()
+        return True
+
+    def handle_stage_4(self, message_text):
+        """Проверка полноты данных целевого пользователя.
+
+        Returns:
+            bool: Флаг продолжения обработки следующим шагом.
+        """
+        out_data_list = self.required_data_out()
+        if not out_data_list:
+            self.stage_4_get_pair()
+            return True
+        if not message_text:
+            self.get_data_from_user(out_data_list[0])
+            return False
+        self.target_user_info[out_data_list[0]] = message_text
+        self.db.set_target_user_info(self.selection_id, self.target_user_info)
+        # Повторная проверка оставшихся данных
+        return True
+
+    def handle_stage_5(self, message_text):
+        """Поиск пары.
+
+        Returns:
+            bool: Флаг продолжения обработки следующим шагом.
+        """
+        if message_text == "нет":
+            self.close_selection()
+            return False
+        shown_user_ids = self.get_shown_user_ids()
+        if not self.pair_user_id or self.pair_user_id in shown_user_ids:
+            add_fields = self.get_search_fields()
+            self.pair_user_id = self.get_candidate_queue(
+                add_fields, dict(self.pair_user_info)).pop(shown_user_ids)
+        self.complete_selection()
+        return False
+
+    def get_search_fields(self):
+        """Расчет параметров поиска пары по данным целевого пользователя.
+
+        Returns:
+            dict: Поля поиска.
+        """
+        # Название города пары, ИД города используется при ранжировании
+        self.pair_user_info["city_id"] = None
+        if isinstance(self.target_user_info["city"], dict):
+            self.pair_user_info["hometown"] = self.target_user_info["city"]["title"]
+            self.pair_user_info["city_id"] = self.target_user_info["city"].get("id")
+        else:
+            self.pair_user_info["hometown"] = self.target_user_info["city"]
+        # Возраст пары
+        a_date = datetime.strptime(
+            self.target_user_info["bdate"], "%d.%m.%Y").date()
+        b_date = date.today()
+        self.pair_user_info["age"] = calculate_years(a_date, b_date)
+        # Пол пары
+        self.pair_user_info["sex"] = 0
+        if self.target_user_info["sex"] == 1:
+            self.pair_user_info["sex"] = 2
+        elif self.target_user_info["sex"] == 2:
+            self.pair_user_info["sex"] = 1
+        self.pair_user_info["interests"] = self.target_user_info.get("interests", "")
+
+        return {
+            "hometown": self.pair_user_info["hometown"],
+            "age_from": self.pair_user_info["age"] - AGE_RANGE,
+            "age_to": self.pair_user_info["age"] + AGE_RANGE,
+            "sex": self.pair_user_info["sex"],
+            "status": 6,
+        }
+
+    # Обработчики шагов подбора: номер шага -> обработчик
+    STAGE_HANDLERS = {
+        0: handle_stage_0,
+        1: handle_stage_1,
+        2: handle_stage_2,
+        3: handle_stage_3,
+        4: handle_stage_4,
+        5: handle_stage_5,
+    }
@@ -0,0 +1,216 @@
+"""Кэш ответов API ВК."""
+
+import hashlib
+import json
+import sqlite3 as sql
+import threading
+import time
+from collections import OrderedDict
+
+# Время жизни ответов по методам API, сек
+DEFAULT_TTLS = {
+    "users.get": 3600,
+    "photos.get": 600,
+}
+
+
+class VkApiCache:
+    """Кэш ответов API ВК с временем жизни по методам.
+
+    Ответы хранятся в памяти (LRU) и, если указан путь до БД, в SQLite,
+    где переживают перезапуск бота. Ответы хранятся сериализованными,
+    поэтому изменение полученного из кэша ответа не меняет кэш.
+    Ответ ВК зависит от того, кто запрашивает (настройки приватности,
+    закрытые профили), поэтому ответы хранятся отдельно для каждого токена.
+
+    Args:
+        max_size (int, optional): Максимальное количество ответов в памяти.
+        ttls (dict, optional): Время жизни ответов по методам API, сек.
+        db_filename (str, optional): Путь до БД кэша.
+    """
+
+    def __init__(self, max_size=10000, ttls=None, db_filename=None):
+        self.max_size = max_size
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.connection = None
+        if db_filename:
+            self.open_db(db_filename)
+
+    def open_db(self, db_filename):
+        """Подключение хранения кэша в SQLite.
+
+        Args:
+            db_filename (str): Путь до БД кэша.
+        """
+        with self._lock:
+            self.connection = sql.connect(db_filename, check_same_thread=False)
+            with self.connection:
+                self.connection.execute("""CREATE TABLE IF NOT EXISTS api_cache(
+                    cache_key TEXT PRIMARY KEY,
+                    method TEXT,
+                    response TEXT,
+                    expires REAL);
+                """)
+
+    @staticmethod
+    def get_viewer(vk_session):
+        """Хэш токена сессии, от имени которой вызывается метод.
+
+        Args:
+            vk_session (object): Сессия ВК или обертка с атрибутом vk_session.
+
+        Returns:
+            str: Хэш токена или пустая строка, если токен неизвестен.
+        """
+        while not hasattr(vk_session, "token") and hasattr(vk_session, "vk_session"):
+            vk_session = vk_session.vk_session
+        token = getattr(vk_session, "token", None)
+        if isinstance(token, dict):
+            token = token.get("access_token")
+        if not token:
+            return ""
+        return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def make_key(method, values, viewer=""):
+        """Ключ кэша для вызова метода.
+
+        Args:
+            method (str): Название метода API.
+            values (dict): Параметры метода.
+            viewer (str, optional): Хэш токена сессии (`get_viewer`).
+
+        Returns:
+            str: Ключ кэша.
+        """
+        return f"{method}:{json.dumps(values, sort_keys=True, ensure_ascii=False)}:{viewer}"
+
+    def call(self, vk_session, method, values):
+        """Вызов метода API с использованием кэша.
+
+        Args:
+            vk_session (object): Сессия ВК.
+            method (str): Название метода API.
+            values (dict): Параметры метода.
+
+        Returns:
+            dict: Ответ API.
+        """
+        if method not in self.ttls:
+            return vk_session.method(method, values)
+        cache_key = self.make_key(method, values, self.get_viewer(vk_session))
+        response = self.get(cache_key)
+        if response is None:
+            response = vk_session.method(method, values)
+            self.set(cache_key, method, response)
+        return response
+
+    def get(self, cache_key):
+        """Получение ответа из кэша.
+
+        Args:
+            cache_key (str): Ключ кэша.
+
+        Returns:
+            dict: Ответ API или None.
+        """
+        now = time.time()
+        with self._lock:
+            item = self._items.get(cache_key)
+            if item and item[0] > now:
+                self._items.move_to_end(cache_key)
+                self.stats["memory_hits"] += 1
+                return json.loads(item[1])
+            if item:
+                del self._items[cache_key]
+            if self.connection:
+                cursor = self.connection.execute(
+                    "SELECT response, expires FROM api_cache WHERE cache_key = ? AND expires > ?;",
+                    (cache_key, now))
+                row = cursor.fetchone()
+                if row:
+                    self.stats["db_hits"] += 1
+                    self._put(cache_key, row[0], row[1])
+                    return json.loads(row[0])
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, cache_key, method, response):
+        """Запись ответа в кэш.
+
+        Args:
+            cache_key (str): Ключ кэша.
+            method (str): Название метода API.
+            response (dict): Ответ API.
+        """
+        expires = time.time() + self.ttls[method]
+        response = json.dumps(response, ensure_ascii=False)
+        with self._lock:
+            self._put(cache_key, response, expires)
+            if self.connection:
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO api_cache(cache_key, method, response, expires) VALUES(?, ?, ?, ?);",
+                        (cache_key, method, response, expires))
+
+    def invalidate(self, method=None, values=None):
+        """Удаление ответов из кэша.
+
+        Args:
+            method (str, optional): Название метода API. Если не указан - очищается весь кэш.
+            values (dict, optional): Параметры метода. Если не указаны - удаляются все ответы метода.
+        """
+        with self._lock:
+            if method and values is not None:
+                # Ответы с этими параметрами удаляются для всех токенов
+                prefix = self.make_key(method, values)
+                for cache_key in [key for key in self._items if key.startswith(prefix)]:
+                    del self._items[cache_key]
+                sql_query = "DELETE FROM api_cache WHERE method = ? AND substr(cache_key, 1, ?) = ?;"
+                params = (method, len(prefix), prefix)
+            elif method:
+                for cache_key in [key for key in self._items if key.startswith(f"{method}:")]:
+                    del self._items[cache_key]
+                sql_query, params = "DELETE FROM api_cache WHERE method = ?;", (method,)
+            else:
+                self._items.clear()
+                sql_query, params = "DELETE FROM api_cache;", ()
+            if self.connection:
+                with self.connection:
+                    self.connection.execute(sql_query, params)
+
+    def purge_expired(self):
+        """Удаление устаревших ответов из БД кэша."""
+        with self._lock:
+            if self.connection:
+                with self.connection:
+                    self.connection.execute(
+                        "DELETE FROM api_cache WHERE expires <= ?;", (time.time(),))
+
+    def get_stats(self):
+        """Статистика попаданий в кэш.
+
+        Returns:
+            dict: Количество попаданий по уровням кэша и промахов.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._items)
+        return stats
+
+    def _put(self, cache_key, response, expires):
+        """Запись ответа в память с вытеснением давно не используемых.
+
+        Args:
+            cache_key (str): Ключ кэша.
+            response (str): Сериализованный ответ API.
+            expires (float): Время устаревания ответа.
+        """
+        self._items[cache_key] = (expires, response)
+        self._items.move_to_end(cache_key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
@@ -0,0 +1,301 @@
+"""Асинхронные инструменты для работы с VK.
+
+Повторяют API `vk.vk_tools`, но выполняют запросы через общий
+пул HTTP-соединений aiohttp, поэтому один процесс может держать
+в работе сотни запросов к ВК одновременно.
+"""
+
+import asyncio
+import time
+from random import randrange
+
+import aiohttp
+
+from monitoring.metrics import metrics
+from vk.photo_rank import get_top_photos
+from vk.rate_limit import (GROUP_RATE_LIMIT, RETRY_ERROR_CODES, USER_RATE_LIMIT,
+                           get_backoff_delay, get_token_bucket)
+from vk.vk_tools import PROFILE_PHOTOS_COUNT, api_cache, get_3_pop_photo
+
+API_URL = "https://api.vk.com/method/"
+
+_http_session = None
+_http_limits = {"limit": 100, "limit_per_host": 100}
+
+
+class AsyncVkApiError(Exception):
+    """Ошибка API ВК.
+
+    Args:
+        method (str): Название метода API.
+        error (dict): Описание ошибки из ответа ВК.
+    """
+
+    def __init__(self, method, error):
+        self.method = method
+        self.error = error
+        self.code = error.get("error_code")
+        super().__init__(f"[{self.code}] {error.get('error_msg')}")
+
+
+def configure_http_pool(limit=100, limit_per_host=100):
+    """Настройка ограничений пула соединений.
+
+    Применяется при создании пула, поэтому вызывается до первого запроса.
+
+    Args:
+        limit (int, optional): Максимальное количество соединений.
+        limit_per_host (int, optional): Максимальное количество соединений с одним хостом.
+    """
+    _http_limits["limit"] = limit
+    _http_limits["limit_per_host"] = limit_per_host
+
+
+def get_http_session():
+    """Получение общего пула HTTP-соединений.
+
+    Returns:
+        aiohttp.ClientSession: HTTP-сессия.
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=_http_limits["limit"],
+            limit_per_host=_http_limits["limit_per_host"],
+            keepalive_timeout=60)
+        _http_session = aiohttp.ClientSession(connector=connector)
+    return _http_session
+
+
+async def close_http_session():
+    """Закрытие общего пула HTTP-соединений."""
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
+
+class AsyncVkSession:
+    """Асинхронная сессия ВК.
+
+    Частота запросов ограничивается той же корзиной токенов,
+    что и у синхронной сессии с этим токеном.
+
+    Args:
+        token (str): Токен ВК.
+        api_version (str, optional): Версия АПИ.
+        rate (float, optional): Количество запросов в секунду.
+        kind (str, optional): Тип токена (group/user).
+        max_retries (int, optional): Количество повторов запроса.
+        backoff (float, optional): Базовая задержка перед повтором, сек.
+    """
+
+    def __init__(self, token, api_version="5.131", rate=USER_RATE_LIMIT, kind="user",
+                 max_retries=5, backoff=0.5):
+        self.token = token
+        self.api_version = api_version
+        self.bucket = get_token_bucket(token, rate, kind)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    async def method(self, method, values=None, raw=False):
+        """Вызов метода API.
+
+        Args:
+            method (str): Название метода API.
+            values (dict, optional): Параметры метода.
+            raw (bool, optional): Вернуть ответ целиком, а не поле response.
+
+        Returns:
+            dict: Ответ API.
+        """
+        data = {key: str(value) for key, value in (values or {}).items()
+                if value is not None}
+        data.setdefault("v", self.api_version)
+        data.setdefault("access_token", self.token)
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                delay = self.bucket.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                async with get_http_session().post(API_URL + method, data=data) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                if "error" not in result:
+                    return result if raw else result["response"]
+                error = AsyncVkApiError(method, result["error"])
+                if error.code not in RETRY_ERROR_CODES or attempt >= self.max_retries:
+                    metrics.inc("vk_errors_total", method=method, code=error.code)
+                    raise error
+                attempt += 1
+                self.bucket.count_retry()
+                await asyncio.sleep(get_backoff_delay(self.backoff, attempt))
+        finally:
+            metrics.observe("vk_method_seconds", time.perf_counter() - start, method=method)
+
+
+async def cached_method(vk_session, method, values):
+    """Вызов метода API с использованием кэша ответов.
+
+    Если кэш хранится в SQLite, обращения к нему выполняются в потоке
+    asyncio.to_thread, чтобы чтение и запись файла не останавливали цикл событий.
+
+    Args:
+        vk_session (AsyncVkSession): Сессия ВК.
+        method (str): Название метода API.
+        values (dict): Параметры метода.
+
+    Returns:
+        dict: Ответ API.
+    """
+    cache_key = api_cache.make_key(method, values, api_cache.get_viewer(vk_session))
+    use_thread = api_cache.connection is not None
+    if use_thread:
+        response = await asyncio.to_thread(api_cache.get, cache_key)
+    else:
+        response = api_cache.get(cache_key)
+    if response is None:
+        response = await vk_session.method(method, values)
+        if use_thread:
+            await asyncio.to_thread(api_cache.set, cache_key, method, response)
+        else:
+            api_cache.set(cache_key, method, response)
+    return response
+
+
+def create_group_session(token, api_version="5.131"):
+    """Создание асинхронной сессии ВК сообщества.
+
+    Args:
+        token (str): Токен сообщества.
+        api_version (str, optional): Версия АПИ. По умолчанию "5.131".
+
+    Returns:
+        AsyncVkSession: Сессия сообщества.
+    """
+    return AsyncVkSession(token, api_version, rate=GROUP_RATE_LIMIT, kind="group")
+
+
+def create_user_session(user_token, api_version="5.131"):
+    """Создание асинхронной сессии пользователя ВК.
+
+    Args:
+        user_token (str): Токен пользователя.
+        api_version (str, optional): Версия АПИ. По умолчанию "5.131".
+
+    Returns:
+        AsyncVkSession: Сессия пользователя.
+    """
+    return AsyncVkSession(user_token, api_version)
+
+
+async def write_message_to_vk_user(vk_session, user_id, message, attachment=""):
+    """Отправка сообщения пользователю от сообщества.
+
+    Args:
+        vk_session (AsyncVkSession): Сессия сообщества ВК.
+        user_id (int): ИД пользователя.
+        message (str): Сообщение пользователю.
+        attachment (str): Перечень вложений через ",".
+    """
+    await vk_session.method('messages.send', {
+        'user_id': user_id,
+        'message': message,
+        'random_id': randrange(10 ** 7),
+        'attachment': attachment, })
+
+
+async def get_vk_user_info(vk_session, user_id, fields=None, use_cache=True):
+    """Получение информации по пользователю.
+
+    Args:
+        vk_session (AsyncVkSession): Сессия пользователя ВК.
+        user_id (int): ИД пользователя.
+        fields (list, optional): Список доп. полей.
+        use_cache (bool, optional): Использовать кэш ответов.
+
+    Returns:
+        dict: Информация о пользователе из ВК.
+    """
+    values = {'user_ids': user_id, 'fields': fields, }
+    if use_cache:
+        user_info = (await cached_method(vk_session, 'users.get', values))[0]
+    else:
+        user_info = (await vk_session.method('users.get', values))[0]
+    return user_info
+
+
+async def get_vk_user_profile_photos(vk_session, user_id):
+    """Получение фотографий из профиля пользователя.
+
+    Args:
+        vk_session (AsyncVkSession): Сессия пользователя ВК.
+        user_id (int): ИД пользователя.
+
+    Returns:
+        dict: Словарь с фотографиями.
+    """
+    return await cached_method(vk_session, 'photos.get', {
+        'owner_id': user_id,
+        'album_id': "profile",
+        "extended": 1,
+        "rev": 1,
+        "count": PROFILE_PHOTOS_COUNT,
+    })
+
+
+async def search_vk_user_info(vk_session, target, fields=None):
+    """Поиск пользователя с получением информации о нем одним запросом.
+
+    Args:
+        vk_session (AsyncVkSession): Сессия пользователя ВК.
+        target (str): Цель поиска.
+        fields (list, optional): Список доп. полей.
+
+    Returns:
+        dict: Информация о пользователе из ВК или None.
+    """
+    target_user_info = None
+    try:
+        target_user_info = await get_vk_user_info(vk_session, target, fields)
+    except AsyncVkApiError:
+        request_dict = {'q': target, "count": 1, "fields": fields}
+        search_result = await vk_session.method('users.search', request_dict)
+        if search_result.get("count"):
+            target_user_info = search_result["items"][0]
+    return target_user_info
+
+
+async def get_vk_user_3_foto_url(vk_session, user_id):
+    """Получение url 3 самых популярных фотографий из профиля пользователя.
+
+    Args:
+        vk_session (AsyncVkSession): Сессия пользователя в ВК.
+        user_id (int): ИД пользователя.
+
+    Returns:
+        list: Список ссылок на фото.
+    """
+    user_photo = await get_vk_user_profile_photos(vk_session, user_id)
+    best_photo_dict = get_3_pop_photo(user_photo["items"])
+    return [photo["url"] for photo in best_photo_dict.values()]
+
+
+async def get_vk_user_3_foto_attachment_value(vk_session, user_id):
+    """Получение значения attachment с 3 самыми популярными фотографиями
+    из профиля пользователя.
+
+    Args:
+        vk_session (AsyncVkSession): Сессия пользователя в ВК.
+        user_id (int): ИД пользователя.
+
+    Returns:
+        str: Значение attachment.
+    """
+    user_photo = await get_vk_user_profile_photos(vk_session, user_id)
+    attachment = ""
+    for item in get_top_photos(user_photo["items"], 3):
+        attachment += f'photo{user_id}_{item["id"]},'
+    return attachment
@@ -0,0 +1,174 @@
+"""Получение событий сообщества через Callback API.
+
+ВК отправляет события POST-запросами на адрес сервера бота. Сервер
+проверяет секретный ключ, кладет событие во внутреннюю очередь и сразу
+отвечает "ok", а обработку выполняет отдельный поток. Повторы событий
+отбрасываются в памяти процесса, поэтому для сообщества работает один
+экземпляр сервера.
+"""
+
+import asyncio
+import hmac
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from aiohttp import web
+from vk_api.bot_longpoll import VkBotLongPoll
+
+from monitoring.metrics import metrics
+from vk.longpoll import get_event_keys
+
+
+def parse_event(raw_event):
+    """Разбор события Callback API в событие Long Poll.
+
+    Формат событий Callback API совпадает с форматом Bots Long Poll.
+
+    Args:
+        raw_event (dict): Событие в формате Callback API.
+
+    Returns:
+        VkBotEvent: Событие.
+    """
+    event_class = VkBotLongPoll.CLASS_BY_EVENT_TYPE.get(
+        raw_event["type"], VkBotLongPoll.DEFAULT_EVENT_CLASS)
+    return event_class(raw_event)
+
+
+class CallbackServer:
+    """HTTP-сервер Callback API сообщества.
+
+    События передаются обработчику handler(event, done) в порядке
+    поступления, как и событий Long Poll. Если внутренняя очередь
+    заполнена, сервер отвечает 503 и ВК повторит отправку позже.
+    Повторные отправки уже принятых событий отбрасываются.
+
+    Args:
+        handler (callable): Обработчик события handler(event, done).
+        group_id (int): ИД сообщества.
+        confirmation (str): Строка подтверждения адреса сервера.
+        secret (str, optional): Секретный ключ из настроек Callback API.
+        host (str, optional): Адрес сервера.
+        port (int, optional): Порт сервера.
+        path (str, optional): Путь, на который ВК отправляет события.
+        queue_size (int, optional): Максимальное количество событий в очереди.
+        seen_size (int, optional): Количество ключей последних событий для отбрасывания повторов.
+    """
+
+    def __init__(self, handler, group_id, confirmation, secret=None, host="0.0.0.0", port=8080,
+                 path="/callback", queue_size=1000, seen_size=10000):
+        self.handler = handler
+        self.group_id = group_id
+        self.confirmation = confirmation
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.path = path
+        self.seen_size = seen_size
+        self.queue = queue.Queue(queue_size)
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def create_app(self):
+        """Создание приложения aiohttp.
+
+        Returns:
+            aiohttp.web.Application: Приложение с обработчиком событий.
+        """
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_request)
+        return app
+
+    async def handle_request(self, request):
+        """Прием запроса Callback API.
+
+        Args:
+            request (aiohttp.web.Request): Запрос ВК.
+
+        Returns:
+            aiohttp.web.Response: Строка подтверждения, "ok" или ошибка.
+        """
+        try:
+            raw_event = await request.json()
+        except ValueError:
+            return self._reject("json", 400)
+        if not isinstance(raw_event, dict) or str(raw_event.get("group_id")) != str(self.group_id):
+            return self._reject("group_id", 403)
+        if raw_event.get("type") == "confirmation":
+            return web.Response(text=self.confirmation)
+        if self.secret and not hmac.compare_digest(str(raw_event.get("secret", "")), self.secret):
+            return self._reject("secret", 403)
+        try:
+            event = parse_event(raw_event)
+            keys = get_event_keys(event)
+        except (KeyError, TypeError):
+            return self._reject("event", 400)
+        return self.accept(event, keys)
+
+    def accept(self, event, keys):
+        """Постановка события в очередь с отбрасыванием повторов.
+
+        Args:
+            event (VkBotEvent): Событие.
+            keys (list): Ключи события.
+
+        Returns:
+            aiohttp.web.Response: "ok" или 503 при заполненной очереди.
+        """
+        with self._lock:
+            if any(key in self._seen for key in keys):
+                metrics.inc("callback_duplicates_total")
+                return web.Response(text="ok")
+            try:
+                self.queue.put_nowait((event, time.perf_counter()))
+            except queue.Full:
+                return self._reject("queue_full", 503)
+            for key in keys:
+                self._seen[key] = None
+            while len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+        metrics.inc("callback_events_total", type=getattr(event.type, "value", event.type))
+        return web.Response(text="ok")
+
+    def _reject(self, reason, status):
+        """Ответ с ошибкой на запрос, не принятый сервером.
+
+        Args:
+            reason (str): Причина для метрики.
+            status (int): Код ответа HTTP.
+
+        Returns:
+            aiohttp.web.Response: Ответ с ошибкой.
+        """
+        metrics.inc("callback_rejected_total", reason=reason)
+        return web.Response(status=status, text=reason)
+
+    def _worker(self):
+        """Цикл передачи событий из очереди обработчику."""
+        while True:
+            event, received = self.queue.get()
+            try:
+                self.handler(event, lambda received=received: metrics.observe(
+                    "callback_event_seconds", time.perf_counter() - received))
+            except Exception as e:
+                print(e)
+
+    def run(self):
+        """Запуск потока обработки и HTTP-сервера до остановки процесса."""
+        metrics.set_gauge("callback_queue_depth", self.queue.qsize)
+        self._thread = threading.Thread(target=self._worker, name="callback-worker", daemon=True)
+        self._thread.start()
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        """Работа HTTP-сервера."""
+        runner = web.AppRunner(self.create_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
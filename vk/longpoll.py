@@ -0,0 +1,287 @@
+"""Bots Long Poll с сохранением сервера, ключа и ts между перезапусками."""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from vk_api.bot_longpoll import VkBotEventType, VkBotLongPoll
+
+from monitoring.metrics import metrics
+
+
+class ResumableBotLongPoll(VkBotLongPoll):
+    """Bots Long Poll, продолжающий работу с сохраненного состояния.
+
+    Сервер и ключ записываются в файл при получении, ts - методом
+    `commit` после обработки событий. После перезапуска первый запрос
+    событий выполняется с сохраненными ключом и ts без запроса
+    groups.getLongPollServer, поэтому необработанные события будут получены
+    повторно. Если ключ устарел, сервер вернет ошибку и ключ будет получен
+    заново. Без сохраненного состояния ключ запрашивается при первом
+    запросе событий, а не при создании.
+
+    Args:
+        vk (VkApi): Сессия сообщества.
+        group_id (int): ИД сообщества.
+        state_filename (str, optional): Путь до файла состояния.
+        wait (int, optional): Время ожидания событий, сек.
+    """
+
+    def __init__(self, vk, group_id, state_filename=None, wait=25):
+        self.vk = vk
+        self.group_id = group_id
+        self.wait = wait
+        self.state_filename = state_filename
+
+        self.url = None
+        self.key = None
+        self.server = None
+        self.ts = None
+        # Последний ts, события до которого обработаны
+        self.committed_ts = None
+        # Ключи событий после committed_ts, которые уже обработаны
+        self.done_keys = []
+
+        self.session = requests.Session()
+        self.load_state()
+
+    def load_state(self):
+        """Загрузка сохраненного состояния сообщества."""
+        if not self.state_filename or not os.path.exists(self.state_filename):
+            return
+        try:
+            with open(self.state_filename, encoding="utf-8") as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError) as e:
+            print(e)
+            return
+        if str(state.get("group_id")) != str(self.group_id):
+            return
+        self.server = self.url = state["server"]
+        self.key = state["key"]
+        self.ts = self.committed_ts = state["ts"]
+        self.done_keys = state.get("done", [])
+
+    def save_state(self):
+        """Запись состояния в файл с заменой предыдущего."""
+        if not self.state_filename:
+            return
+        state = {
+            "group_id": self.group_id, "server": self.server, "key": self.key,
+            "ts": self.committed_ts, "done": self.done_keys}
+        temp_filename = self.state_filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_filename, self.state_filename)
+
+    def update_longpoll_server(self, update_ts=True):
+        """Получение сервера и ключа с записью состояния.
+
+        Args:
+            update_ts (bool, optional): Получить также новый ts.
+        """
+        super().update_longpoll_server(update_ts)
+        if self.committed_ts is None:
+            # Событий до первого полученного ts бот уже не получит
+            self.committed_ts = self.ts
+        self.save_state()
+
+    def check(self):
+        """Получение событий от сервера один раз.
+
+        Returns:
+            list: События.
+        """
+        if self.key is None:
+            self.update_longpoll_server()
+        return super().check()
+
+    def commit(self, ts, done_keys=()):
+        """Запись ts, события до которого обработаны.
+
+        Args:
+            ts (str): ts Long Poll.
+            done_keys (iterable, optional): Ключи уже обработанных событий после ts.
+        """
+        done_keys = list(done_keys)
+        if ts == self.committed_ts and done_keys == self.done_keys:
+            return
+        self.committed_ts = ts
+        self.done_keys = done_keys
+        self.save_state()
+
+
+def get_event_keys(event):
+    """Ключи события для отбрасывания повторов.
+
+    Args:
+        event (VkBotEvent): Событие Long Poll.
+
+    Returns:
+        list: ИД события и, для сообщений, ИД сообщения в беседе.
+    """
+    keys = []
+    event_id = event.raw.get("event_id")
+    if event_id:
+        keys.append(event_id)
+    if event.type == VkBotEventType.MESSAGE_NEW:
+        message = event.obj["message"]
+        message_id = message.get("conversation_message_id") or message.get("id")
+        if message_id:
+            keys.append(f"message:{message['peer_id']}:{message_id}")
+    return keys
+
+
+class PolledBatch:
+    """События одного ответа сервера Long Poll.
+
+    Args:
+        ts (str): ts, возвращенный сервером вместе с событиями.
+        received (float): Время получения, сек (time.time).
+    """
+
+    def __init__(self, ts, received):
+        self.ts = ts
+        self.received = received
+        # Время создания самого старого события пачки
+        self.oldest = received
+        self.remaining = 0
+        # Ключи обработанных и отброшенных как повтор событий пачки
+        self.done_keys = []
+        # Все события пачки переданы обработчику
+        self.closed = False
+
+
+class LongPollConsumer:
+    """Обработка событий Long Poll с сохранением ts после обработки.
+
+    События передаются обработчику handler(event, done), который вызывает
+    done() после обработки события, в том числе из другого потока. ts
+    ответа сервера сохраняется, когда обработаны все события этого
+    и предыдущих ответов, поэтому после сбоя или перезапуска бот получает
+    заново только необработанные события, в исходном порядке. Уже
+    обработанные события после сохраненного ts записываются вместе с ним
+    и при повторном получении отбрасываются, как и повторы с тем же ИД
+    события или сообщения в пределах процесса.
+
+    Args:
+        longpoll (ResumableBotLongPoll): Long Poll сообщества.
+        handler (callable): Обработчик события handler(event, done).
+        seen_size (int, optional): Количество ключей последних событий для отбрасывания повторов.
+        retry_delay (float, optional): Пауза перед повторным запросом после ошибки, сек.
+    """
+
+    def __init__(self, longpoll, handler, seen_size=10000, retry_delay=1):
+        self.longpoll = longpoll
+        self.handler = handler
+        self.seen_size = seen_size
+        self.retry_delay = retry_delay
+        self._seen = OrderedDict.fromkeys(longpoll.done_keys)
+        self._batches = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Бесконечный цикл получения и обработки событий."""
+        metrics.set_gauge("longpoll_pending_events", self.get_pending)
+        metrics.set_gauge("longpoll_lag_seconds", self.get_lag)
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                metrics.inc("longpoll_errors_total", error=type(e).__name__)
+                print(e)
+                time.sleep(self.retry_delay)
+
+    def poll(self):
+        """Один запрос событий и передача их обработчику."""
+        ts = self.longpoll.ts
+        events = self.longpoll.check()
+        batch = PolledBatch(self.longpoll.ts, time.time())
+        if not events and ts is not None and batch.ts != ts:
+            # Сервер вернул новый ts без событий: история событий потеряна
+            metrics.inc("longpoll_history_lost_total")
+        with self._lock:
+            self._batches.append(batch)
+        try:
+            for event in events:
+                self._dispatch(batch, event)
+        finally:
+            with self._lock:
+                batch.closed = True
+                self._commit()
+
+    def _dispatch(self, batch, event):
+        """Передача события обработчику, если оно не повтор.
+
+        Args:
+            batch (PolledBatch): Пачка события.
+            event (VkBotEvent): Событие.
+        """
+        keys = get_event_keys(event)
+        with self._lock:
+            if any(key in self._seen for key in keys):
+                # Ключ повтора хранится до сохранения ts его пачки
+                batch.done_keys.extend(keys)
+                metrics.inc("longpoll_duplicates_total")
+                return
+            for key in keys:
+                self._seen[key] = None
+            while len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+            batch.remaining += 1
+            if event.type == VkBotEventType.MESSAGE_NEW:
+                batch.oldest = min(batch.oldest, event.obj["message"].get("date", batch.received))
+        metrics.inc("longpoll_events_total", type=getattr(event.type, "value", event.type))
+        try:
+            self.handler(event, lambda: self._done(batch, keys))
+        except Exception as e:
+            # Событие с ошибкой обработчика не задерживает сохранение ts
+            print(e)
+            self._done(batch, keys)
+
+    def _done(self, batch, keys):
+        """Отметка обработки события.
+
+        Args:
+            batch (PolledBatch): Пачка события.
+            keys (list): Ключи события.
+        """
+        with self._lock:
+            batch.remaining -= 1
+            batch.done_keys.extend(keys)
+            self._commit()
+
+    def _commit(self):
+        """Сохранение ts обработанных подряд пачек, вызывается под блокировкой."""
+        ts = None
+        while self._batches and self._batches[0].closed and not self._batches[0].remaining:
+            ts = self._batches.pop(0).ts
+        done_keys = [key for batch in self._batches for key in batch.done_keys]
+        if ts is None and done_keys == self.longpoll.done_keys:
+            return
+        try:
+            self.longpoll.commit(ts or self.longpoll.committed_ts, done_keys)
+        except OSError as e:
+            print(e)
+
+    def get_pending(self):
+        """Количество полученных, но еще не обработанных событий.
+
+        Returns:
+            int: Количество событий.
+        """
+        with self._lock:
+            return sum(batch.remaining for batch in self._batches)
+
+    def get_lag(self):
+        """Отставание обработки от поступления событий.
+
+        Returns:
+            float: Возраст самого старого необработанного события, сек.
+        """
+        with self._lock:
+            oldest = [batch.oldest for batch in self._batches if batch.remaining]
+        return time.time() - min(oldest) if oldest else 0.0
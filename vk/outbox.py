@@ -0,0 +1,129 @@
+"""Объединение исходящих сообщений за время обработки события."""
+
+from vk.vk_tools import write_message_to_vk_user, write_message_to_vk_users
+
+# Ограничения ВК на одно сообщение
+MAX_MESSAGE_LENGTH = 4096
+MAX_ATTACHMENTS = 10
+
+
+class OutgoingMessage:
+    """Исходящее сообщение одному или нескольким получателям.
+
+    Args:
+        peer_ids (tuple): ИД получателей.
+        message (str): Текст сообщения.
+        attachments (list): Вложения.
+    """
+
+    def __init__(self, peer_ids, message, attachments):
+        self.peer_ids = peer_ids
+        self.message = message
+        self.attachments = attachments
+
+    def merge(self, message, attachments):
+        """Добавление текста и вложений следующего сообщения тому же получателю.
+
+        Args:
+            message (str): Текст сообщения.
+            attachments (list): Вложения.
+
+        Returns:
+            bool: Флаг объединения, False - сообщение не помещается в ограничения ВК.
+        """
+        merged_message = "\n".join(text for text in (self.message, message) if text)
+        if (len(merged_message) > MAX_MESSAGE_LENGTH
+                or len(self.attachments) + len(attachments) > MAX_ATTACHMENTS):
+            return False
+        self.message = merged_message
+        self.attachments.extend(attachments)
+        return True
+
+
+class VkOutbox:
+    """Исходящие сообщения, объединяемые при отправке.
+
+    Сообщения одному получателю, отправленные подряд, объединяются
+    в одно с сохранением порядка текста и вложений, поэтому на обработку
+    события приходится меньше вызовов messages.send.
+
+    Поддерживает метод `method` сессии ВК, поэтому может передаваться
+    вместо сессии в `write_message_to_vk_user`. Остальные методы API
+    вызываются через сессию без задержки.
+
+    Args:
+        vk_session (object): Сессия ВК или пакет вызовов `VkApiBatch`.
+    """
+
+    def __init__(self, vk_session):
+        self.vk_session = vk_session
+        self.messages = []
+        # Последнее сообщение каждого получателя, к которому можно добавить текст
+        self._last_messages = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def method(self, method, values=None):
+        """Вызов метода API с откладыванием простых сообщений одному получателю.
+
+        Args:
+            method (str): Название метода API.
+            values (dict, optional): Параметры метода.
+
+        Returns:
+            object: Результат вызова или None для отложенного сообщения.
+        """
+        values = values or {}
+        peer_id = values.get("peer_id", values.get("user_id"))
+        if method == "messages.send" and peer_id and set(values) <= {
+                "user_id", "peer_id", "message", "attachment", "random_id"}:
+            self.send(peer_id, values.get("message", ""), values.get("attachment", ""))
+            return None
+        return self.vk_session.method(method, values)
+
+    def send(self, peer_id, message, attachment=""):
+        """Добавление сообщения пользователю.
+
+        Args:
+            peer_id (int): ИД получателя.
+            message (str): Текст сообщения.
+            attachment (str, optional): Перечень вложений через ",".
+        """
+        attachments = [item for item in attachment.split(",") if item]
+        last_message = self._last_messages.get(peer_id)
+        if last_message and last_message.merge(message, attachments):
+            return
+        outgoing_message = OutgoingMessage((peer_id,), message, attachments)
+        self.messages.append(outgoing_message)
+        self._last_messages[peer_id] = outgoing_message
+
+    def broadcast(self, peer_ids, message, attachment=""):
+        """Добавление сообщения нескольким пользователям.
+
+        Args:
+            peer_ids (list): ИД получателей.
+            message (str): Текст сообщения.
+            attachment (str, optional): Перечень вложений через ",".
+        """
+        attachments = [item for item in attachment.split(",") if item]
+        self.messages.append(OutgoingMessage(tuple(peer_ids), message, attachments))
+        # Следующие сообщения не объединяются с отправленными до рассылки
+        self._last_messages.clear()
+
+    def flush(self):
+        """Отправка накопленных сообщений в порядке добавления."""
+        messages = self.messages
+        self.messages = []
+        self._last_messages.clear()
+        for outgoing_message in messages:
+            attachment = ",".join(outgoing_message.attachments)
+            if len(outgoing_message.peer_ids) == 1:
+                write_message_to_vk_user(
+                    self.vk_session, outgoing_message.peer_ids[0], outgoing_message.message, attachment)
+            else:
+                write_message_to_vk_users(
+                    self.vk_session, outgoing_message.peer_ids, outgoing_message.message, attachment)
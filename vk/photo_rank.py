@@ -0,0 +1,71 @@
+"""Выбор лучших фотографий пользователя."""
+
+import heapq
+
+# Типы размеров фото ВК по возрастанию, если размеры в пикселях не указаны
+SIZE_TYPES = "smopqrxyzw"
+
+SECONDS_IN_DAY = 86400
+
+
+def get_photo_features(item):
+    """Получение признаков популярности фото.
+
+    Args:
+        item (dict): Фото из ВК.
+
+    Returns:
+        dict: Лайки, комментарии, репосты и дата публикации в днях.
+    """
+    return {
+        "likes": item.get("likes", {}).get("count", 0),
+        "comments": item.get("comments", {}).get("count", 0),
+        "reposts": item.get("reposts", {}).get("count", 0),
+        "recency": item.get("date", 0) / SECONDS_IN_DAY,
+    }
+
+
+def get_photo_score(item, weights=None):
+    """Расчет оценки фото.
+
+    Args:
+        item (dict): Фото из ВК.
+        weights (dict, optional): Веса признаков.
+
+    Returns:
+        float | tuple: Взвешенная сумма признаков или, без весов,
+            лайки и комментарии: при равенстве лайков выше фото с большим числом комментариев.
+    """
+    if not weights:
+        return item.get("likes", {}).get("count", 0), item.get("comments", {}).get("count", 0)
+    features = get_photo_features(item)
+    return sum(features[name] * weight for name, weight in weights.items())
+
+
+def get_top_photos(user_photo_items, k=3, weights=None):
+    """Получение k лучших фото за один проход.
+
+    Args:
+        user_photo_items (list): Фото из ВК.
+        k (int, optional): Количество фото.
+        weights (dict, optional): Веса признаков (likes, comments, reposts, recency),
+            без весов фото упорядочиваются по лайкам, затем по комментариям.
+
+    Returns:
+        list: Фото по убыванию оценки.
+    """
+    return heapq.nlargest(
+        k, user_photo_items, key=lambda item: get_photo_score(item, weights))
+
+
+def get_size_area(size):
+    """Площадь фото для сравнения размеров.
+
+    Args:
+        size (dict): Размер фото из ВК.
+
+    Returns:
+        tuple: Площадь в пикселях и порядковый номер типа размера.
+    """
+    size_type = SIZE_TYPES.find(size.get("type", ""))
+    return size.get("width", 0) * size.get("height", 0), size_type
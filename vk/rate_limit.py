@@ -0,0 +1,185 @@
+"""Ограничение частоты запросов к API ВК."""
+
+import random
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+
+from vk_api import VkApi
+from vk_api.exceptions import ApiError
+
+from monitoring.metrics import metrics
+from monitoring.profiling import event_profiler
+
+# Лимиты запросов в секунду для токенов сообщества и пользователя
+GROUP_RATE_LIMIT = 20
+USER_RATE_LIMIT = 3
+
+# Ошибки "Слишком много запросов в секунду" и "Flood control"
+RETRY_ERROR_CODES = (6, 9)
+
+
+class TokenBucket:
+    """Корзина токенов для ограничения частоты запросов.
+
+    Запросы сверх лимита не отклоняются, а ждут своей очереди. Задержанные
+    и повторенные запросы учитываются счетчиками метрик сразу, так как
+    корзина удаляется вместе с последней сессией своего токена.
+
+    Args:
+        rate (float): Количество запросов в секунду.
+        kind (str): Тип токена (group/user).
+    """
+
+    def __init__(self, rate, kind):
+        self.rate = rate
+        self.kind = kind
+        self.tokens = float(rate)
+        self.last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Получение разрешения на запрос с ожиданием при превышении лимита.
+
+        Returns:
+            float: Время ожидания, сек.
+        """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def reserve(self):
+        """Резервирование разрешения на запрос без ожидания.
+
+        Returns:
+            float: Время, которое нужно подождать перед запросом, сек.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                float(self.rate), self.tokens + (now - self.last_update) * self.rate)
+            self.last_update = now
+            # Отрицательный остаток - очередь запросов, ожидающих разрешения
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            metrics.inc("vk_rate_limit_throttled_total", kind=self.kind)
+        return delay
+
+    def count_retry(self):
+        """Учет повторного запроса."""
+        metrics.inc("vk_rate_limit_retried_total", kind=self.kind)
+
+
+_buckets = weakref.WeakValueDictionary()
+_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(token, rate, kind):
+    """Получение корзины токенов, общей для всех сессий с одним токеном.
+
+    Args:
+        token (str): Токен ВК.
+        rate (float): Количество запросов в секунду.
+        kind (str): Тип токена (group/user).
+
+    Returns:
+        TokenBucket: Корзина токенов.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(token)
+        if bucket is None:
+            bucket = TokenBucket(rate, kind)
+            _buckets[token] = bucket
+    return bucket
+
+
+def get_backoff_delay(backoff, attempt):
+    """Задержка перед повтором запроса со случайным разбросом.
+
+    Args:
+        backoff (float): Базовая задержка, сек.
+        attempt (int): Номер повтора, начиная с 1.
+
+    Returns:
+        float: Задержка, сек.
+    """
+    return backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+
+def get_rate_limit_stats():
+    """Получение количества токенов с ограничением запросов по типам токенов.
+
+    Returns:
+        dict: Тип токена -> количество токенов.
+    """
+    stats = {}
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    for bucket in buckets:
+        stats[bucket.kind] = stats.get(bucket.kind, 0) + 1
+    return stats
+
+
+class RateLimitedVkApi(VkApi):
+    """Сессия ВК с ограничением частоты запросов и повтором при превышении лимитов.
+
+    Args:
+        token (str): Токен ВК.
+        api_version (str): Версия АПИ.
+        rate (float, optional): Количество запросов в секунду.
+        kind (str, optional): Тип токена (group/user).
+        max_retries (int, optional): Количество повторов запроса.
+        backoff (float, optional): Базовая задержка перед повтором, сек.
+    """
+
+    # Частоту запросов ограничивает корзина токенов
+    RPS_DELAY = 0
+
+    def __init__(self, token, api_version, rate=USER_RATE_LIMIT, kind="user",
+                 max_retries=5, backoff=0.5):
+        super().__init__(token=token, api_version=api_version)
+        # Запросы разных потоков не нужно выполнять по одному
+        self.lock = nullcontext()
+        self.bucket = get_token_bucket(token, rate, kind)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def method(self, method, values=None, **kwargs):
+        """Вызов метода API с ожиданием лимита и повтором при ошибках 6 и 9.
+
+        Args:
+            method (str): Название метода API.
+            values (dict, optional): Параметры метода.
+
+        Returns:
+            dict: Ответ API.
+        """
+        event_profiler.record_vk_method(method)
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                self.bucket.acquire()
+                try:
+                    return super().method(method, values, **kwargs)
+                except ApiError as error:
+                    if error.code not in RETRY_ERROR_CODES or attempt >= self.max_retries:
+                        metrics.inc("vk_errors_total", method=method, code=error.code)
+                        raise
+                    attempt += 1
+                    self.bucket.count_retry()
+                    time.sleep(get_backoff_delay(self.backoff, attempt))
+        finally:
+            # Время вызова учитывает ожидание лимита и повторы
+            metrics.observe("vk_method_seconds", time.perf_counter() - start, method=method)
+
+    def too_many_rps_handler(self, error):
+        """Ошибка передается в `method` для повтора с задержкой.
+
+        Args:
+            error (ApiError): Исключение.
+        """
+        raise error
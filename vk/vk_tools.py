@@ -1,28 +1,45 @@
 """Инструменты для работы с VK."""
 
-from ast import While
+import json
 from random import randrange
-from time import sleep
-from sqlalchemy import true
 
-from vk_api import VkApi
-from vk_api.bot_longpoll import VkBotLongPoll
+from vk_api.exceptions import ApiError
 
+from monitoring.metrics import metrics
+from vk.api_cache import VkApiCache
+from vk.longpoll import ResumableBotLongPoll
+from vk.photo_rank import get_size_area, get_top_photos
+from vk.rate_limit import GROUP_RATE_LIMIT, RateLimitedVkApi
 
-def create_group_session(group_id, token, api_version="5.131"):
+# Кэш ответов users.get и photos.get
+api_cache = VkApiCache()
+
+# Максимальное количество получателей одного вызова messages.send
+MAX_PEER_IDS = 100
+
+# Количество фото профиля, запрашиваемых для выбора лучших (максимум photos.get)
+PROFILE_PHOTOS_COUNT = 1000
+
+
+def create_group_session(group_id, token, api_version="5.131", longpoll_state=None):
     """Создание сессии ВК сообщества.
 
+    Токен не проверяется отдельным запросом: неверный токен
+    вернет ошибку при первом обращении к API.
+
     Args:
         group_id (int): ИД сообщества.
         token (str): Токен сообщества.
         api_version (str, optional): Версия АПИ. По умолчанию "5.131".
+        longpoll_state (str, optional): Путь до файла с сервером, ключом и ts Long Poll
+            для продолжения работы после перезапуска.
 
     Returns:
         vk_session, longpoll: Сессии сообщества
     """
-    vk_session = VkApi(token=token, api_version=api_version)
-    vk_session._auth_token()
-    longpoll = VkBotLongPoll(vk_session, group_id)
+    vk_session = RateLimitedVkApi(
+        token, api_version, rate=GROUP_RATE_LIMIT, kind="group")
+    longpoll = ResumableBotLongPoll(vk_session, group_id, longpoll_state)
     return vk_session, longpoll
 
 
@@ -36,10 +53,101 @@ def create_user_session(user_token, api_version="5.131"):
     Returns:
         vk_user_session: Сессия пользователя.
     """
-    vk_user_session = VkApi(token=user_token, api_version=api_version)
+    vk_user_session = RateLimitedVkApi(user_token, api_version)
     return vk_user_session
 
 
+class VkBatchResult:
+    """Отложенный результат вызова метода API из пакета.
+
+    Args:
+        method (str): Название метода API.
+        values (dict): Параметры метода.
+    """
+
+    def __init__(self, method, values):
+        self.method = method
+        self.values = values
+        self.result = None
+        self.error = None
+
+
+class VkApiBatch:
+    """Пакет вызовов API ВК, отправляемых одним запросом execute.
+
+    Поддерживает метод `method` сессии ВК, поэтому может передаваться
+    вместо сессии в функции отправки данных (например, `write_message_to_vk_user`).
+    Результаты вызовов доступны только после отправки пакета, поэтому
+    методы, результат которых нужен сразу, вызываются через сессию.
+    Ошибка отдельного вызова не прерывает отправку остальных: после
+    отправки всего пакета выбрасывается ApiError первого неудачного вызова.
+
+    Args:
+        vk_session (object): Сессия ВК.
+    """
+
+    MAX_CALLS = 25
+
+    def __init__(self, vk_session):
+        self.vk_session = vk_session
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def method(self, method, values=None):
+        """Добавление вызова метода API в пакет.
+
+        Args:
+            method (str): Название метода API.
+            values (dict, optional): Параметры метода.
+
+        Returns:
+            VkBatchResult: Отложенный результат вызова.
+        """
+        values = {key: value for key, value in (values or {}).items()
+                  if value is not None}
+        call = VkBatchResult(method, values)
+        self.calls.append(call)
+        if len(self.calls) >= self.MAX_CALLS:
+            self.flush()
+        return call
+
+    def flush(self):
+        """Отправка накопленных вызовов.
+
+        Raises:
+            ApiError: Ошибка первого неудачного вызова пакета.
+        """
+        failed_calls = []
+        while self.calls:
+            calls = self.calls[:self.MAX_CALLS]
+            del self.calls[:self.MAX_CALLS]
+            if len(calls) == 1:
+                call = calls[0]
+                call.result = self.vk_session.method(call.method, call.values)
+                continue
+            code = "return [{}];".format(",".join(
+                f"API.{call.method}({json.dumps(call.values, ensure_ascii=False)})"
+                for call in calls))
+            response = self.vk_session.method(
+                "execute", {"code": code}, raw=True)
+            execute_errors = iter(response.get("execute_errors", []))
+            for call, result in zip(calls, response.get("response", [])):
+                if result is False:
+                    call.error = dict({"error_code": None, "error_msg": ""}, **next(execute_errors, {}))
+                    metrics.inc("vk_errors_total", method=call.method, code=call.error["error_code"])
+                    failed_calls.append(call)
+                else:
+                    call.result = result
+        if failed_calls:
+            call = failed_calls[0]
+            raise ApiError(self.vk_session, call.method, call.values, False, call.error)
+
+
 def write_message_to_vk_user(vk_session, user_id, message, attachment=""):
     """Отправка сообщения пользователю от сообщества.
 
@@ -56,19 +164,43 @@ def write_message_to_vk_user(vk_session, user_id, message, attachment=""):
         'attachment': attachment, })
 
 
-def get_vk_user_info(vk_session, user_id, fields=None):
+def write_message_to_vk_users(vk_session, peer_ids, message, attachment=""):
+    """Отправка одного сообщения нескольким пользователям от сообщества.
+
+    Получатели отправляются порциями по MAX_PEER_IDS в одном вызове messages.send.
+
+    Args:
+        vk_session (object): Сессия сообщества ВК.
+        peer_ids (list): ИД получателей.
+        message (str): Сообщение пользователям.
+        attachment (str): Перечень вложений через ",".
+    """
+    peer_ids = list(peer_ids)
+    for i in range(0, len(peer_ids), MAX_PEER_IDS):
+        vk_session.method('messages.send', {
+            'peer_ids': ",".join(str(peer_id) for peer_id in peer_ids[i:i + MAX_PEER_IDS]),
+            'message': message,
+            'random_id': randrange(10 ** 7),
+            'attachment': attachment, })
+
+
+def get_vk_user_info(vk_session, user_id, fields=None, use_cache=True):
     """Получение информации по пользователю.
 
     Args:
         vk_session (object): Сессия пользователя ВК.
         user_id (int): ИД пользователя.
         fields (list, optional): Список доп. полей.
+        use_cache (bool, optional): Использовать кэш ответов.
 
     Returns:
         dict: Информация о пользователе из ВК.
     """
-    user_info = vk_session.method(
-        'users.get', {'user_ids': user_id, 'fields': fields, })[0]
+    values = {'user_ids': user_id, 'fields': fields, }
+    if use_cache:
+        user_info = api_cache.call(vk_session, 'users.get', values)[0]
+    else:
+        user_info = vk_session.method('users.get', values)[0]
     return user_info
 
 
@@ -82,59 +214,57 @@ def get_vk_user_profile_photos(vk_session, user_id):
     Returns:
         dict: Словарь с фотографиями.
     """
-    user_profile_photos = vk_session.method('photos.get', {
+    user_profile_photos = api_cache.call(vk_session, 'photos.get', {
         'owner_id': user_id,
         'album_id': "profile",
         "extended": 1,
         "rev": 1,
+        "count": PROFILE_PHOTOS_COUNT,
     })
     return user_profile_photos
 
 
-def search_vk_user(vk_session, target):
-    """Поиск пользователя.
+def search_vk_user_info(vk_session, target, fields=None):
+    """Поиск пользователя с получением информации о нем одним запросом.
 
     Args:
         vk_session (object): Сессия пользователя ВК.
         target (str): Цель поиска.
+        fields (list, optional): Список доп. полей.
 
     Returns:
-        int: Идентификатор пользователя.
+        dict: Информация о пользователе из ВК или None.
     """
-    target_user_id = None
+    target_user_info = None
     try:
-        user_info = get_vk_user_info(vk_session, target)
-        target_user_id = user_info["id"]
+        target_user_info = get_vk_user_info(vk_session, target, fields)
     except:
-        request_dict = {'q': target, "count": 1}
+        request_dict = {'q': target, "count": 1, "fields": fields}
         search_result = vk_session.method('users.search', request_dict)
-        if not search_result.get("count"):
-            target_user_id = search_result["items"][0]["id"]
-    return target_user_id
+        if search_result.get("count"):
+            target_user_info = search_result["items"][0]
+    return target_user_info
 
 
-def select_pair(vk_session, add_fields, shown_user_ids_list):
-    """Подбор пары.
+def search_vk_users_items(vk_session, add_fields, offset=0, count=1000, fields=None):
+    """Получение страницы результатов поиска пользователей с полями профиля.
 
     Args:
         vk_session (object): Сессия пользователя ВК.
         add_fields (dict): Поля поиска.
-        shown_user_ids_list (list): Список ИД ранее показанных пользователей.
+        offset (int, optional): Смещение от начала результатов.
+        count (int, optional): Количество результатов (не более 1000).
+        fields (str, optional): Поля профиля через ",".
 
     Returns:
-        int: Идентификатор подобранного пользователя.
+        list, int: Пользователи и общее количество найденных.
     """
-    pair_user_id = -1
-    request_dict = {"q": ""}
+    request_dict = {"q": "", "offset": offset, "count": count}
+    if fields:
+        request_dict["fields"] = fields
     request_dict.update(add_fields)
     search_result = vk_session.method('users.search', request_dict)
-    if search_result.get("count"):
-        search_result_items = search_result["items"]
-        for item in search_result_items:
-            if item["id"] not in shown_user_ids_list:
-                pair_user_id = item["id"]
-                break
-    return pair_user_id
+    return search_result.get("items", []), search_result.get("count", 0)
 
 
 def get_best_size_url(sizes):
@@ -147,86 +277,28 @@ def get_best_size_url(sizes):
         str: Ссылка на фото.
     """
     best_size_photo_url = None
-    sizes_dict = {}
-    for size in sizes:
-        sizes_dict[size["type"]] = size["url"]
-    if sizes_dict:
-        best_size_photo_url = sizes_dict[max(sizes_dict.keys())]
+    if sizes:
+        best_size_photo_url = max(sizes, key=get_size_area)["url"]
     return best_size_photo_url
 
 
-def get_min_pop_photo_id(best_photo_dict):
-    """Получение наименее популярной фотографии.
-
-    Args:
-        best_photo_dict (dict): Словарь с фотографиями.
-
-    Returns:
-        int: Идентификатор фото.
-    """
-    min_pop_photo_id = None
-    for photo_id, photo_params in best_photo_dict.items():
-        if not min_pop_photo_id:
-            min_pop_photo_id = photo_id
-        else:
-            min_photo = best_photo_dict[min_pop_photo_id]
-            min_likes_count = min_photo["likes_count"]
-            min_comments_count = min_photo["comments_count"]
-            current_photo = photo_params
-            current_likes_count = current_photo["likes_count"]
-            current_comments_count = current_photo["comments_count"]
-            if current_likes_count < min_likes_count:
-                min_pop_photo_id = photo_id
-            elif current_likes_count == min_likes_count:
-                if current_comments_count < min_comments_count:
-                    min_pop_photo_id = photo_id
-    return min_pop_photo_id
-
-
-def get_3_pop_photo(user_photo_items):
+def get_3_pop_photo(user_photo_items, weights=None):
     """Получение 3 самых популярных фотографий.
 
     Args:
         user_photo_items (dict): Словарь с фотографиями из ВК.
+        weights (dict, optional): Веса признаков популярности.
 
     Returns:
-        dict: Словарь фото.
+        dict: Словарь фото по убыванию популярности.
     """
-    pop_photo_url_list = []
     best_photo_dict = {}
-    for item in user_photo_items:
-        likes_count = item["likes"]["count"]
-        comments_count = item["comments"]["count"]
-        current_photo_id = item["id"]
-        if len(best_photo_dict) < 3:
-            best_photo_dict[current_photo_id] = {
-                "likes_count": likes_count,
-                "comments_count": comments_count,
-                "url": get_best_size_url(item["sizes"]),
-            }
-        else:
-            min_pop_photo_id = get_min_pop_photo_id(best_photo_dict)
-            min_photo = best_photo_dict[min_pop_photo_id]
-            min_likes_count = min_photo["likes_count"]
-            min_comments_count = min_photo["comments_count"]
-            current_photo_id = item["id"]
-            current_likes_count = item["likes"]["count"]
-            current_comments_count = item["comments"]["count"]
-            if current_likes_count < min_likes_count:
-                best_photo_dict.pop(min_pop_photo_id)
-                best_photo_dict[current_photo_id] = {
-                    "likes_count": likes_count,
-                    "comments_count": comments_count,
-                    "url": get_best_size_url(item["sizes"]),
-                }
-            elif current_likes_count == min_likes_count:
-                if current_comments_count < min_comments_count:
-                    best_photo_dict.pop(min_pop_photo_id)
-                    best_photo_dict[current_photo_id] = {
-                        "likes_count": likes_count,
-                        "comments_count": comments_count,
-                        "url": get_best_size_url(item["sizes"]),
-                    }
+    for item in get_top_photos(user_photo_items, 3, weights):
+        best_photo_dict[item["id"]] = {
+            "likes_count": item["likes"]["count"],
+            "comments_count": item["comments"]["count"],
+            "url": get_best_size_url(item["sizes"]),
+        }
     return best_photo_dict
 
 
@@ -241,12 +313,8 @@ def get_vk_user_3_foto_url(vk_session, user_id):
         list: Список ссылок на фото.
     """
     user_photo = get_vk_user_profile_photos(vk_session, user_id)
-    photo_links = []
-    if 0 < user_photo["count"] <= 3:
-        for item in user_photo["items"]:
-            photo_links.append(get_best_size_url(item["sizes"]))
-    elif user_photo["count"] > 3:
-        photo_links = get_3_pop_photo(user_photo["items"])
+    best_photo_dict = get_3_pop_photo(user_photo["items"])
+    photo_links = [photo["url"] for photo in best_photo_dict.values()]
     return photo_links
 
 
@@ -263,13 +331,8 @@ def get_vk_user_3_foto_attachment_value(vk_session, user_id):
     """
     user_photo = get_vk_user_profile_photos(vk_session, user_id)
     attachment = ""
-    if 0 < user_photo["count"] <= 3:
-        for item in user_photo["items"]:
-            attachment += f'photo{user_id}_{item["id"]},'
-    elif user_photo["count"] > 3:
-        best_photo_dict = get_3_pop_photo(user_photo["items"])
-        for key in best_photo_dict:
-            attachment += f'photo{user_id}_{key},'
+    for item in get_top_photos(user_photo["items"], 3):
+        attachment += f'photo{user_id}_{item["id"]},'
     return attachment
 
 